@@ -0,0 +1,181 @@
+"""
+Benchmarks for constraints.
+
+Measures Symbol evaluation against expression depth, isinstance checks
+against the number of constraint arguments, condition decorator and context
+manager overhead against undecorated baselines, and descriptor assignment
+and access.  Timings are the best of several runs, in nanoseconds per call.
+
+Results can be saved by name and compared with a previous run::
+
+    python benchmarks/run.py --save 0.120126
+    python benchmarks/run.py --compare 0.120126
+
+Comparison exits with status 1 if any benchmark is slower than the saved
+result by more than the threshold.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constraints.proxy import Symbol
+from constraints.constraints import Constraints, bind
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+X = Symbol()
+
+def symbol_evaluate(depth):
+    expr = X
+    for i in range(depth - 1):
+        expr = expr + 1
+    expr = expr >= 0
+    return lambda: expr.__evaluate__(1)
+
+def instancecheck(count):
+    # Modulo comparisons aren't folded into one interval test, so each
+    # argument is checked separately.
+    const = Constraints(*[X % (i + 2) >= 0 for i in range(count)])
+    return lambda: isinstance(1, const)
+
+const = Constraints(X > 0)
+
+def undecorated():
+    def foo(x):
+        return x
+    return lambda: foo(1)
+
+def decorated(*conditions):
+    def foo(x):
+        return x
+    for condition in conditions:
+        foo = condition(foo)
+    return lambda: foo(1)
+
+def context_manager(condition):
+    def block():
+        x = 1
+        with condition:
+            pass
+    return block
+
+def empty_block():
+    def block():
+        x = 1
+    return block
+
+class Record(object):
+    value = const("value")
+
+class SlottedRecord(object):
+    __slots__ = ("_value",)
+    value = const("value")
+
+def record():
+    obj = Record()
+    obj.value = 1
+    return obj
+
+def descriptor_set(class_):
+    obj = class_()
+    def assign():
+        obj.value = 1
+    return assign
+
+def descriptor_get(class_):
+    obj = class_()
+    obj.value = 1
+    return lambda: obj.value
+
+def benchmarks():
+    """Returns a list of (name, no argument callable) pairs to time."""
+    cases = []
+    for depth in (1, 4, 16, 64):
+        cases.append(("symbol_evaluate_depth_%d" % depth, symbol_evaluate(depth)))
+    for count in (1, 2, 4, 8):
+        cases.append(("instancecheck_args_%d" % count, instancecheck(count)))
+    cases.extend([
+        ("call_undecorated", undecorated()),
+        ("call_precondition", decorated(const.precondition("x"))),
+        ("call_postcondition", decorated(const.postcondition())),
+        ("call_pre_and_postcondition",
+         decorated(const.precondition("x"), const.postcondition())),
+        ("block_empty", empty_block()),
+        ("block_precondition_name", context_manager(const.precondition("x"))),
+        ("block_postcondition_name", context_manager(const.postcondition("x"))),
+        ("block_invariant_name", context_manager(const.invariant("x"))),
+        ("block_precondition_callable",
+         context_manager(const.precondition(lambda: 1))),
+        ("block_invariant_bound",
+         context_manager(const.invariant(bind(record(), "value")))),
+        ("descriptor_set", descriptor_set(Record)),
+        ("descriptor_get", descriptor_get(Record)),
+        ("descriptor_set_slots", descriptor_set(SlottedRecord)),
+        ("descriptor_get_slots", descriptor_get(SlottedRecord)),
+    ])
+    return cases
+
+def run(number, repeat, pattern=None):
+    """Time every benchmark, returning a dict of nanoseconds per call."""
+    results = {}
+    for (name, function) in benchmarks():
+        if pattern and pattern not in name:
+            continue
+        best = min(timeit.Timer(function).repeat(repeat, number))
+        results[name] = best / number * 1e9
+        print("%-36s %12.1f ns" % (name, results[name]))
+    return results
+
+def compare(results, saved, threshold):
+    """Print the change from `saved` and return the names which regressed."""
+    regressions = []
+    print("\n%-36s %12s %12s %8s" % ("benchmark", "saved", "current", "ratio"))
+    for name in sorted(results):
+        if name not in saved:
+            continue
+        ratio = results[name] / saved[name]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print("%-36s %12.1f %12.1f %8.2f%s" % (name, saved[name], results[name],
+                                               ratio, flag))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=20000,
+                        help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="timing runs per benchmark; the best is kept")
+    parser.add_argument("--filter", help="only run benchmarks containing this")
+    parser.add_argument("--save", metavar="NAME",
+                        help="save the results as results/NAME.json")
+    parser.add_argument("--compare", metavar="NAME",
+                        help="compare with results/NAME.json")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fractional slowdown counted as a regression")
+    args = parser.parse_args(argv)
+    results = run(args.number, args.repeat, args.filter)
+    if args.save:
+        if not os.path.isdir(RESULTS):
+            os.makedirs(RESULTS)
+        with open(os.path.join(RESULTS, args.save + ".json"), "w") as f:
+            json.dump({"python": platform.python_version(),
+                       "implementation": platform.python_implementation(),
+                       "results": results}, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(os.path.join(RESULTS, args.compare + ".json")) as f:
+            saved = json.load(f)["results"]
+        if compare(results, saved, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,8 +4,14 @@
 from proxy import Symbol
 from constraints import Constraints
 import constraints
+import containers
+import dispatch
+import metrics
+import optimizer
+import schema
 import util
 import proxy
+import pickle
 
 def test_instancecheck():
     assert isinstance(3, const1)
@@ -122,6 +128,819 @@ def test_decorator_post_assertfails():
     except AssertionError:
         pass
 
+def test_compile():
+    X = Symbol()
+    assert (X * 2 + 1 >= 5).__compile__()(2)
+    assert not (X * 2 + 1 >= 5).__compile__()(1)
+    assert (X[-1].upper() == "H").__compile__()("bleh")
+    assert (10 - X).__compile__()(3) == 7
+    assert (X.replace("a", "b")).__compile__()("aa") == "bb"
+
+def test_compile_deep():
+    X = Symbol()
+    expr = X
+    for i in range(200):
+        expr = expr + 1
+    assert expr.__compile__()(0) == 200
+
+def test_instancecheck_callable():
+    const = Constraints(lambda x: x > 0, X < 10)
+    assert isinstance(5, const)
+    assert not isinstance(-5, const)
+    assert not isinstance(50, const)
+
+def test_evaluate_reentrant():
+    import threading
+    expr = X * 2 + 1
+    errors = []
+    def worker(n):
+        for i in range(2000):
+            if expr.__evaluate__(n) != n * 2 + 1 or \
+               isinstance(n, const1) != (n * 2 + 1 >= 5):
+                errors.append(n)
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert X._f == 3
+
+def test_mask():
+    try:
+        import numpy
+    except ImportError:
+        from unittest import SkipTest
+        raise SkipTest("numpy is not installed")
+    values = numpy.arange(-5, 10)
+    assert (const1.mask(values) == (values * 2 + 1 >= 5)).all()
+    assert (const2.mask(values) == [isinstance(v, const2) for v in values]).all()
+    words = numpy.array(["bleh", "bleH", "blab"], dtype=object)
+    assert list(const4.mask(words)) == [True, True, False]
+    mixed = Constraints(X > 0, lambda x: x % 3 == 0)
+    assert list(mixed.mask(numpy.arange(-3, 7))) == \
+        [False] * 4 + [False, False, True, False, False, True]
+
+def test_bulk():
+    values = iter(range(-3, 6))
+    assert list(const1.filter(values)) == [2, 3, 4, 5]
+    assert const1.partition([1, 2, 3, -1]) == ([2, 3], [1, -1])
+    assert const1.count_valid(xrange(100)) == 98
+    assert const1.first_invalid([5, 4, 1, 0]) == (2, 1)
+    assert const1.first_invalid(xrange(2, 100)) is None
+
+def test_adaptive():
+    calls = []
+    def expensive(x):
+        calls.append(x)
+        return True
+    const = Constraints(expensive, X > 0, adaptive=True)
+    for i in xrange(const._check.interval * const._check.period):
+        assert not isinstance(-1, const)
+    assert const._check.order == [1, 0]
+    del calls[:]
+    assert not isinstance(-1, const)
+    assert isinstance(1, const)
+    assert calls == [1]
+
+def test_cache():
+    const = Constraints(X[-1].upper() == "H", cache=2)
+    assert isinstance("bleh", const)
+    assert isinstance("bleh", const)
+    assert not isinstance("blab", const)
+    assert isinstance("blah", const)
+    assert isinstance("bleh", const)
+    assert const.cache_info() == (1, 4, 2, 2)
+    assert not isinstance(["b", "a"], const)
+    assert const.cache_info() == (1, 4, 2, 2)
+    const.cache_clear()
+    assert const.cache_info() == (0, 0, 2, 0)
+    assert const1.cache_info() is None
+
+def test_cache_typed():
+    const = Constraints(lambda t: all(type(x) is int for x in t), cache=8)
+    assert isinstance((1,), const)
+    assert not isinstance((1.0,), const)
+    assert isinstance(frozenset([1]), const)
+    assert not isinstance(frozenset([1.0]), const)
+    assert const.cache_info().misses == 4
+
+def test_cache_mutable():
+    class Box(object):
+        def __init__(self, v):
+            self.v = v
+    const = Constraints(X.v > 0, cache=8)
+    box = Box(1)
+    assert isinstance(box, const)
+    box.v = -1
+    assert not isinstance(box, const)
+    assert const.cache_info().currsize == 0
+
+def test_cache_identity():
+    class Frozen(object):
+        __hash__ = None
+        def __init__(self, value):
+            self.value = value
+    const = Constraints(X.value > 0, cache=8, cache_identity=True)
+    frozen = Frozen(1)
+    assert isinstance(frozen, const)
+    assert isinstance(frozen, const)
+    assert not isinstance(Frozen(-1), const)
+    assert const.cache_info().hits == 1
+
+def test_decorator_pre_signature():
+    @const1.precondition("y")
+    def foo(x, y=2, *args, **kwargs):
+        return x + y
+    assert foo(1) == 3
+    assert foo(1, y=5) == 6
+    assert foo.__wrapped__(1, y=0) == 1
+    import inspect
+    assert inspect.getargspec(foo) == inspect.getargspec(foo.__wrapped__)
+    try:
+        foo(1, 0)
+        assert False
+    except AssertionError:
+        pass
+
+def test_decorator_pre_kwargs():
+    @const1.precondition("x")
+    def foo(**kwargs):
+        return kwargs["x"]
+    assert foo(x=3) == 3
+    try:
+        foo(x=0)
+        assert False
+    except AssertionError:
+        pass
+    try:
+        @const1.precondition("x")
+        def bar(y):
+            return y
+        assert False
+    except TypeError:
+        pass
+
+def test_decorator_fused():
+    order = []
+    def recorder(label, result=True):
+        def check(value):
+            order.append(label)
+            return result
+        return check
+    pre1 = Constraints(recorder("pre1")).precondition("x")
+    post1 = Constraints(recorder("post1")).postcondition("x")
+    pre2 = Constraints(recorder("pre2")).precondition("y")
+    post2 = Constraints(recorder("post2")).postcondition("x")
+    @pre1
+    @post1
+    @pre2
+    @post2
+    def foo(x, y):
+        return x + y
+    assert foo(1, 2) == 3
+    assert order == ["pre1", "pre2", "post2", "post1"]
+    assert foo.__wrapped__.__name__ == "foo"
+    assert not hasattr(foo.__wrapped__, "__contracts__")
+    assert len(foo.__contracts__[1]) == len(foo.__contracts__[2]) == 2
+
+def test_decorator_fused_foreign():
+    import functools
+    calls = []
+    def logged(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            calls.append(kwargs)
+            return f(*args, **kwargs)
+        return wrapper
+    pre = const1.precondition("x")
+    post = const1.postcondition()
+    @pre
+    @logged
+    @post
+    def foo(x):
+        return x
+    assert foo(x=3) == 3 and calls == [{"x": 3}]
+    try:
+        foo(x=0)
+        assert False
+    except AssertionError:
+        pass
+    assert calls == [{"x": 3}]
+
+def test_descriptor_per_instance():
+    foo, bar = Test(), Test()
+    foo.x = 3
+    bar.x = 4
+    assert (foo.x, bar.x) == (3, 4)
+    assert foo.__dict__ == {"x": 3}
+    del foo.x
+    assert foo.x is None
+    assert isinstance(Test.x, const1)
+
+def test_descriptor_slots():
+    class Point(object):
+        __slots__ = ("_x", "_y")
+        x = const1()
+        y = const1("y")
+    point = Point()
+    assert point.x is None
+    point.x = 3
+    point.y = 5
+    assert (point.x, point.y, point._x) == (3, 5, 3)
+    try:
+        point.y = 0
+        assert False
+    except AssertionError:
+        pass
+    assert point.y == 5
+
+def test_modes():
+    def foo(x):
+        return x
+    with constraints.contract_mode(constraints.OFF):
+        assert const1.precondition("x")(foo) is foo
+        bar = Test()
+        bar.x = 0
+        with const1.invariant("x"):
+            x = 0
+        assert constraints.get_mode() == (constraints.OFF, 0.0)
+    assert constraints.get_mode() == (constraints.FULL, 1.0)
+    checked = const1.precondition("x")(foo)
+    with constraints.contract_mode(constraints.SAMPLED, 0.5):
+        failures = 0
+        for i in range(1000):
+            try:
+                checked(0)
+            except AssertionError:
+                failures += 1
+        assert 300 < failures < 700
+    try:
+        checked(0)
+        assert False
+    except AssertionError:
+        pass
+
+def test_set_mode():
+    try:
+        constraints.set_mode(constraints.OFF)
+        bar = Test()
+        bar.x = 0
+        assert bar.x == 0
+    finally:
+        constraints.set_mode(constraints.FULL)
+    try:
+        constraints.set_mode(constraints.SAMPLED)
+        assert False
+    except ValueError:
+        pass
+
+def test_metrics():
+    const = Constraints(X > 0, X % 2 == 0, metrics="even")
+    for value in [2, 4, -1, 3, 6]:
+        isinstance(value, const)
+    snapshot = const.metrics.snapshot()
+    assert snapshot["name"] == "even"
+    assert (snapshot["checks"], snapshot["passes"], snapshot["failures"]) == (5, 3, 2)
+    first, second = snapshot["predicates"]
+    assert first["name"] == "X > 0" and first["failures"] == 1
+    assert second["checks"] == 4 and second["failures"] == 1
+    assert snapshot["p99"] >= snapshot["p50"] > 0
+    assert snapshot in metrics.snapshot()
+
+def test_metrics_condition():
+    pre = const1.precondition("x", metrics=True)
+    @pre
+    def foo(x):
+        return x
+    foo(3)
+    try:
+        foo(0)
+    except AssertionError:
+        pass
+    snapshot = pre.metrics.snapshot()
+    assert snapshot["name"] == "pre-condition x"
+    assert (snapshot["checks"], snapshot["failures"]) == (2, 1)
+
+def test_interned():
+    Y = Symbol()
+    assert (Y * 2 + 1) is (Y * 2 + 1)
+    assert (Y + 1) is not (Y + 1.0)
+    assert (Y + [1]) is not (Y + [1])
+    negative = Y * -0.0
+    assert (Y * 0.0) is not negative and (Y * -0.0) is negative
+    from decimal import Decimal
+    assert (Y + Decimal("1.0")) is not (Y + Decimal("1.00"))
+    assert Y.upper() is Y.upper()
+
+def test_shared_subexpressions():
+    calls = []
+    class Word(object):
+        def upper(self):
+            calls.append(self)
+            return "A"
+    const = Constraints(X.upper() == "A", X.upper() != "B", X.upper() < "C")
+    assert isinstance(Word(), const)
+    assert len(calls) == 1
+    expr = X * 2.0 + 1
+    const = Constraints(expr >= 5, expr < 100, expr % 3 == 0)
+    assert const._check.__source__.count("* 2.0") == 1
+    assert [n for n in range(60) if isinstance(n, const)] == \
+        [n for n in range(60) if 5 <= n * 2 + 1 < 100 and (n * 2 + 1) % 3 == 0]
+
+def test_intervals():
+    expr = X * 2 + 1
+    const = Constraints(expr >= 5, expr < 100, 7 - X != 0)
+    assert "2 <= x <= 49 and x != 7" in const._check.__source__
+    for value in range(-10, 60) + [2.0, 1.9999999999999998, 49.5, 10L ** 20]:
+        assert isinstance(value, const) == (5 <= value * 2 + 1 < 100 and value != 7)
+    assert not isinstance(True, Constraints(X * 3 > 5, X < 10))
+    assert isinstance("ab", Constraints(X * 2 + "c" == "ababc", X * 1 == "ab"))
+    empty = Constraints(X - 1 > 5, -X > -3)
+    assert not any(isinstance(n, empty) for n in range(-10, 10))
+    assert all(v in optimizer.interval(2 - X * 3 <= 7) for v in [-1, 0, 100])
+    assert -2 not in optimizer.interval(2 - X * 3 <= 7)
+    assert optimizer.interval(X * 2 == 3).empty
+    assert optimizer.interval(X * 2.0 == 3) is None
+
+def test_intervals_guard():
+    guarded = Constraints(X > 0, lambda x: 100 // x > 1, X < 1000)
+    assert not isinstance(0, guarded) and not isinstance(-5, guarded)
+    assert isinstance(20, guarded) and not isinstance(60, guarded)
+    assert not isinstance(1000, guarded)
+
+def test_dispatcher():
+    number = lambda x: isinstance(x, (int, float))
+    word = Constraints(lambda x: isinstance(x, str), X.lower() == "get")
+    classes = [Constraints(X >= 10 * i, X < 10 * (i + 1)) for i in range(20)]
+    classes += [Constraints(X == "GET"), Constraints(X == "PUT"), word,
+                Constraints(number, X > 50, X % 2 == 0, X != 60)]
+    dispatcher = dispatch.ConstraintDispatcher(classes)
+    values = [-5, 0, 9, 55, 56, 60, 199, 250, 55.5, "GET", "PUT", "get", [1]]
+    for value in values:
+        expected = [const for const in classes if isinstance(value, const)]
+        assert dispatcher.matching(value) == expected
+        assert dispatcher.first(value) == (expected[0] if expected else None)
+
+def test_dispatcher_empty_interval():
+    between = Constraints(X > 5, X < 6)
+    dispatcher = dispatch.ConstraintDispatcher([between, const1])
+    assert dispatcher.matching(5.5) == [between, const1]
+    assert dispatcher.matching(5) == [const1]
+
+def test_dispatcher_handlers():
+    dispatcher = dispatch.ConstraintDispatcher()
+    @dispatcher.register(Constraints(X < 0))
+    def negative(value):
+        return "negative"
+    dispatcher.register(int, lambda value: "int")
+    assert dispatcher(-1) == "negative"
+    assert dispatcher(1) == "int"
+    try:
+        dispatcher(1.5)
+        assert False
+    except LookupError:
+        pass
+
+def test_dispatcher_deferred_handler():
+    dispatcher = dispatch.ConstraintDispatcher()
+    register = dispatcher.register(Constraints(X < 0))
+    dispatcher.register(int, lambda value: "int")
+    register(lambda value: "negative")
+    assert dispatcher(-1) == "negative"
+    assert dispatcher(1) == "int"
+
+def test_multipattern():
+    patterns = util.MultiPattern({"read": "GET|HEAD", "write": "POST|PUT",
+                                  "double": r"(.)\1", "short": "[A-Z]{1,3}$",
+                                  "caseless": "(?i)get"})
+    assert sorted(patterns._separate) == ["caseless", "double"]
+    assert patterns.matching("GET") == set(["read", "short", "caseless"])
+    assert patterns.matching("PUTS") == set(["write"])
+    assert patterns.matching("xx") == set(["double"])
+    assert patterns.matching("") == set()
+    readable = Constraints(patterns.matcher("read"), patterns.matcher("short"))
+    assert isinstance("HEAD", Constraints(patterns.matcher("read")))
+    assert not isinstance("HEAD", readable)
+    assert isinstance("get", Constraints(patterns.any()))
+    assert util.matches("a+")("aa") and util._compile("a+") is util._compile("a+")
+
+def test_multipattern_many():
+    items = util.MultiPattern(["item%d$" % i for i in range(150)] +
+                              ["(x)" * 60 + "%d" % i for i in range(3)])
+    assert len(items._merged) == 5 and not items._separate
+    assert items.matching("item149") == set(["item149$"])
+    assert items.matching("x" * 60 + "2") == set(["(x)" * 60 + "2"])
+
+def test_collections():
+    checked = []
+    def positive(x):
+        checked.append(x)
+        return x > 0
+    each = util.Each(X, Constraints(positive))
+    assert isinstance([1, 2, 3], Constraints(each))
+    del checked[:]
+    assert not isinstance([1, -2, 3, 4], Constraints(each))
+    assert checked == [1, -2]
+    assert util.first_failure(each, [1, -2, 3, 4]) == 1
+    assert util.first_failure(each, [1, 2]) is None
+    assert util.Each(X, const1) is util.Each(X, const1)
+    assert proxy.describe(util.SumOf(X) < 10) == "_sum_of(X) < 10"
+    bounded = Constraints(util.Each(X, const1), util.SumOf(X) < 10,
+                          util.LenOf(X) >= 2, util.MaxOf(X) <= util.MinOf(X) * 2)
+    assert isinstance([2, 3], bounded)
+    assert not isinstance([3, 3, 4], bounded)
+    assert not isinstance([2, 5], bounded)
+    assert not isinstance([4], bounded)
+    assert isinstance(["bleh", "blab"], Constraints(util.AnyOf(X, const3)))
+    assert not isinstance(["blab"], Constraints(util.AnyOf(X, const3)))
+    try:
+        import numpy
+    except ImportError:
+        return
+    array = numpy.array([3, 4, 1, 5])
+    assert util.first_failure(util.Each(X, const1), array) == 2
+    assert isinstance(array, Constraints(util.AnyOf(X, const2), util.SumOf(X) == 13))
+
+
+def test_pickle():
+    expr = X * 2 + 1
+    args = pickle.loads(pickle.dumps((expr > 3, expr < X[0], X.upper()), 2))
+    assert [proxy.describe(arg) for arg in args] == \
+        ["((X * 2) + 1) > 3", "((X * 2) + 1) < X[0]", "X.upper()"]
+    assert args[0].parent is args[1].parent
+    assert args[0].__evaluate__(2) and not args[0].__evaluate__(1)
+    restored = Constraints(*pickle.loads(pickle.dumps(const2.args)))
+    assert [n for n in range(10) if isinstance(n, restored)] == [1, 5, 7, 9]
+    positive = constraints.CompactConstraints(X > 0)
+    assert positive(1)
+    (each,) = pickle.loads(pickle.dumps((util.Each(X, positive),), 2))
+    assert each.__evaluate__([1, 2]) and not each.__evaluate__([1, 0])
+
+def test_validate_parallel():
+    values = range(-20, 20) + [2.5, 4.0]
+    expected = [i for (i, v) in enumerate(values) if not isinstance(v, const2)]
+    assert const2.validate_parallel(values, workers=2, chunksize=7) == expected
+    assert const1.validate_parallel(iter(range(100)), workers=2) == [0, 1]
+
+def test_decorator_generator():
+    @const1.precondition("n")
+    @const1.postcondition()
+    def countdown(n):
+        while n > 0:
+            n -= 1
+            yield n
+    values = countdown(4)
+    assert next(values) == 3 and next(values) == 2
+    try:
+        next(values)
+        assert False
+    except AssertionError:
+        pass
+    try:
+        countdown(0)
+        assert False
+    except AssertionError:
+        pass
+
+def test_decorator_generator_throw():
+    @const1.postcondition()
+    def retrying():
+        try:
+            yield 5
+        except ValueError:
+            yield 2
+        yield 1
+    values = retrying()
+    assert next(values) == 5
+    assert values.throw(ValueError) == 2
+    try:
+        next(values)
+        assert False
+    except constraints.ConstraintViolation as violation:
+        assert violation.value == 1
+
+def test_acheck():
+    import threading
+    started = []
+    gate = threading.Event()
+    def lookup(value):
+        started.append(value)
+        gate.wait(5)
+        return value + 0 != 7
+    const = Constraints(X > 0, lookup, lookup, lookup)
+    pending = const.acheck(5, concurrency=2)
+    done = []
+    pending.add_done_callback(done.append)
+    assert not pending.done() and len(started) <= 2
+    gate.set()
+    assert pending.result(5) and started == [5, 5, 5]
+    assert not const.acheck(7).result(5)
+    assert not const.acheck(-1).result(5) and -1 not in started
+    try:
+        const.acheck("x", concurrency=1).result(5)
+        assert False
+    except TypeError:
+        pass
+    assert const.acheck(1.5).result(5) and done == [pending]
+
+def test_contextmanager_reentrant():
+    post = const1.postcondition("x")
+    def count(x):
+        with post:
+            if x > 2:
+                count(x - 1)
+            x += 1
+    count(5)
+    try:
+        count(1)
+        assert False
+    except AssertionError:
+        pass
+    assert post._frames.stack == []
+
+def test_contextmanager_bound():
+    bar = Test()
+    bar.x = 3
+    invariant = const1.invariant(constraints.bind(bar, "x"), metrics=True)
+    with invariant:
+        bar.x = 4
+    assert invariant.metrics.name == "invariant condition Test.x"
+    namespace = {"y": 0}
+    try:
+        with const1.postcondition("y", namespace=namespace):
+            namespace["y"] = 1
+        assert False
+    except AssertionError:
+        pass
+
+def test_class_invariant():
+    checked = []
+    def positive(value):
+        checked.append(value)
+        return value > 0
+    ordered = Constraints(X.low <= X.high).invariant()
+    counted = Constraints(positive).invariant("count")
+    @ordered
+    @counted
+    class Range(object):
+        def __init__(self, low, high):
+            self.low = low
+            self.high = high
+            self.count = 1
+        def set_low(self, low):
+            self.low = low
+            self.bump()
+        def bump(self):
+            self.count += 1
+        def width(self):
+            return self.high - self.low
+    assert Range.__invariants__.attributes == {"low": [1], "high": [1],
+                                               "count": [0]}
+    span = Range(1, 5)
+    assert span.width() == 4 and span.set_low(2) is None
+    assert checked == [1, 2]
+    try:
+        span.set_low(10)
+        assert False
+    except AssertionError:
+        pass
+    span.low = 10
+    try:
+        Range(5, 1)
+        assert False
+    except AssertionError:
+        pass
+    class Wide(Range):
+        def widen(self):
+            self.high += 1
+    Wide = Constraints(X > 1).invariant("high")(Wide)
+    assert len(Wide.__invariants__.conditions) == 3
+    assert Wide(1, 2).widen() is None
+    class Narrow(Range):
+        def narrow(self):
+            self.high -= 2
+    Narrow = ordered(Narrow)
+    assert len(Narrow.__invariants__.conditions) == 2
+    try:
+        Narrow(1, 2).narrow()
+        assert False
+    except AssertionError:
+        pass
+
+def test_class_invariant_methods():
+    total = Constraints(X.total() >= 0).invariant()
+    class Account(object):
+        def __init__(self):
+            self.items = []
+        def add(self, amount):
+            self.items.append(amount)
+        def total(self):
+            return sum(self.items)
+    Checked = total(Account)
+    account = Checked()
+    account.add(3)
+    try:
+        account.add(-5)
+        assert False
+    except AssertionError:
+        pass
+    with constraints.contract_mode(constraints.OFF):
+        class Unchecked(object):
+            def total(self):
+                return -1
+        assert total(Unchecked) is Unchecked
+    assert not hasattr(Unchecked, "__invariants__")
+    assert not hasattr(Unchecked.total, "__checks_invariants__")
+
+def test_constrained_list():
+    checked = []
+    def positive(value):
+        checked.append(value)
+        return value > 0
+    bounded = Constraints(X.sum <= 20, X.max < 10)
+    values = containers.ConstrainedList(Constraints(positive), [3, 1],
+                                        aggregate=bounded)
+    values.append(4)
+    values[0:2] = [5, 5]
+    assert checked == [3, 1, 4, 5, 5]
+    for change in (lambda: values.append(-1), lambda: values.extend([9, 9]),
+                   lambda: values.insert(0, 10)):
+        try:
+            change()
+            assert False
+        except AssertionError:
+            pass
+    assert values == [5, 5, 4] and values.aggregates.sum == 14
+    del values[:2]
+    values.remove(4)
+    assert values.aggregates.len == 0 and values.aggregates.max is None
+
+def test_constrained_list_strings():
+    words = containers.ConstrainedList(
+        Constraints(lambda w: isinstance(w, str)),
+        aggregate=Constraints(lambda a: a.len < 3))
+    words.append("x")
+    words.extend(["y"])
+    assert words.aggregates.sum is None and words.aggregates.max == "y"
+    try:
+        words.append("z")
+        assert False
+    except AssertionError:
+        pass
+    assert words == ["x", "y"] and words.aggregates.len == 2
+
+def test_constrained_list_rollback():
+    numbers = containers.ConstrainedList(object, [1, 2],
+                                         aggregate=Constraints(X.sum < 100))
+    try:
+        numbers.append("a")
+        assert False
+    except TypeError:
+        pass
+    assert numbers.aggregates.len == 2 and numbers.aggregates.sum == 3
+    lists = containers.ConstrainedList(list, [[1], [2]],
+                                       aggregate=Constraints(X.max <= [5]))
+    assert lists.pop() == [2]
+    assert lists.aggregates.len == 1 and lists.aggregates.max == [1]
+    short = containers.ConstrainedList(int, [1], aggregate=Constraints(X.len <= 5))
+    assert short.aggregates.sum is None
+
+def test_constrained_dict():
+    values = containers.ConstrainedDict(const1, {"a": 2}, b=3,
+                                        aggregate=Constraints(X.sum < 10))
+    values["a"] = 4
+    try:
+        values.update(c=3)
+        assert False
+    except AssertionError:
+        pass
+    try:
+        values["c"] = 0
+        assert False
+    except AssertionError:
+        pass
+    assert values == {"a": 4, "b": 3} and values.aggregates.sum == 7
+    assert values.pop("a") == 4 and values.aggregates.sum == 3
+
+def test_violation():
+    rendered = []
+    class Large(int):
+        def __repr__(self):
+            rendered.append(self)
+            return "Large" * 100
+    try:
+        Test().x = Large(0)
+        assert False
+    except constraints.ConstraintViolation as violation:
+        assert rendered == []
+        assert violation.constraint is const1 and violation.value == 0
+        assert violation.index == 0
+        assert violation.expression == "((X * 2) + 1) >= 5"
+        message = str(violation)
+        assert message.startswith("Specified value (LargeLarge")
+        assert len(message) < 200 and len(rendered) == 1
+    try:
+        const2.postcondition()(lambda: 3)()
+        assert False
+    except AssertionError as violation:
+        assert (violation.value, violation.index) == (3, 1)
+        assert str(violation) == ("The value (3) did not meet the specified"
+                                  " post-condition: X != 3")
+
+def test_violation_recorded():
+    calls = []
+    def odd(value):
+        calls.append(value)
+        return value % 2
+    for options in ({}, {"metrics": True}, {"cache": 4}):
+        const = Constraints(X > 0, odd, **options)
+        class Holder(object):
+            x = const()
+        try:
+            Holder().x = 4
+            assert False
+        except constraints.ConstraintViolation as violation:
+            del calls[:]
+            assert violation.args == (const, 4)
+            assert violation.index == 1 and str(violation).endswith(": odd")
+            assert calls == []
+    const = Constraints(odd, X > 0)
+    violation = constraints.ConstraintViolation(const, -1)
+    assert violation.index is None and calls == []
+    import weakref
+    class Big(object):
+        v = -1
+    big = Big()
+    alive = weakref.ref(big)
+    assert not isinstance(big, Constraints(X.v > 0))
+    del big
+    assert alive() is None
+
+def test_compact():
+    odd = constraints.CompactConstraints(X > 0, X % 2 == 1)
+    assert odd._check is None
+    assert odd(3) and not odd(2) and not odd(-1)
+    assert isinstance(3, odd.as_class()) and odd.as_class() is odd.as_class()
+    @constraints.Precondition(odd, "x")
+    def foo(x):
+        return x
+    assert foo(5) == 5
+    try:
+        foo(4)
+        assert False
+    except constraints.ConstraintViolation as violation:
+        assert violation.expression == "(X % 2) == 1"
+    dispatcher = dispatch.ConstraintDispatcher([odd, const1])
+    assert dispatcher.matching(2) == [const1]
+    try:
+        object.__getattribute__(X + 1, "__dict__")
+        assert False
+    except AttributeError:
+        pass
+
+def test_schema():
+    Order = schema.load({
+        "type": "object",
+        "required": ["id", "quantity"],
+        "properties": {
+            "id": {"type": "string", "pattern": "^[A-Z]{3}-[0-9]+$"},
+            "quantity": {"type": "integer", "minimum": 1, "maximum": 100},
+            "price": {"type": ["number", "null"], "exclusiveMinimum": 0},
+            "tags": {"type": "array", "items": {"type": "string"},
+                     "maxItems": 2, "uniqueItems": True},
+        },
+        "additionalProperties": False,
+    })
+    order = {"id": "ABC-1", "quantity": 3}
+    assert isinstance(order, Order)
+    invalid = [{"id": "ABC-1"}, {"id": "abc", "quantity": 3},
+               {"id": "ABC-1", "quantity": True}, {"id": "ABC-1", "quantity": 0},
+               dict(order, price=0), dict(order, tags=["a", "a"]),
+               dict(order, tags=["a", 1]), dict(order, other=1), [order]]
+    assert not any(isinstance(value, Order) for value in invalid)
+    assert isinstance(dict(order, price=None, tags=["a", "b"]), Order)
+    assert len(Order.args) == 1 and "    for _t" in Order.args[0].__source__
+
+def test_schema_keywords():
+    untyped = schema.compile_schema({"minimum": 3, "maxLength": 2,
+                                     "enum": [1, 5, "ab", None]})
+    assert [untyped(v) for v in (1, 5, "ab", None, 4)] == \
+        [False, True, True, True, False]
+    assert not isinstance([1], schema.load({"enum": ["a", "b"]}))
+    assert isinstance([1], schema.load({"enum": ["a", [1]]}))
+    flags = schema.compile_schema({"enum": [0, 1, {"a": [False]}]})
+    assert [flags(v) for v in (0, 1.0, True, False, {"a": [False]}, {"a": [0]})] \
+        == [True, True, False, False, True, False]
+    off = schema.compile_schema({"const": False})
+    assert off(False) and not off(0)
+    unique = schema.compile_schema({"uniqueItems": True})
+    assert unique([1, True]) and not unique([1, 1.0])
+    try:
+        schema.compile_schema({"properties": {"a": {"minimun": 1}}})
+        assert False
+    except ValueError:
+        pass
 
 if __name__ == "__main__":
     import nose
@@ -11,18 +11,801 @@ Constraint classes generated by :class:`Constraints` can validate instance
 attribute values when used as descriptors.  The condition classes provide
 context managers, and both :class:`Precondition` and :class:`Postcondition`
 can be used as function decorators.
+
+Values which fail a check raise :class:`ConstraintViolation`.
+
+Contract checking (conditions and descriptor assignments) can be turned off
+or sampled process-wide with :func:`set_mode`, or for the current thread with
+:class:`contract_mode`.
 """
 
-from sys import _getframe
+from sys import _getframe, exc_info
 from abc import ABCMeta
-from proxy import Symbol
-from decorator import decorator
-from inspect import getcallargs
+from threading import Event, Lock, local
+from random import random
+from timeit import default_timer
+from collections import namedtuple
+from repr import Repr
+from functools import partial
+from weakref import WeakSet, ref
+from types import FunctionType, MemberDescriptorType
+from proxy import Symbol, Compiler, describe, attributes, _key
+from metrics import Metrics
+from optimizer import INTEGERS, Interval, integer_intervals
+from decorator import FunctionMaker
+from inspect import getargspec, isclass, isgeneratorfunction
+from itertools import ifilter, imap, islice
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+OFF = "off"
+SAMPLED = "sampled"
+FULL = "full"
+
+class _Mode(local):
+    """
+    Contract checking mode.  The class attributes hold the process-wide
+    setting and instance attributes override it for one thread.  `rate` is
+    the fraction of calls or assignments which are checked.
+    """
+    mode = FULL
+    rate = 1.0
+
+_mode = _Mode()
+_mode_lock = Lock()
+
+def _rate(mode, rate):
+    if mode == FULL:
+        return 1.0
+    if mode == OFF:
+        return 0.0
+    if mode == SAMPLED:
+        if rate is None or not 0.0 <= rate <= 1.0:
+            raise ValueError("Sampled mode requires a rate between 0 and 1")
+        return float(rate)
+    raise ValueError("Unknown contract mode: %r" % (mode,))
+
+def _enabled():
+    """Returns True if the current contract check should be performed."""
+    rate = _mode.rate
+    return rate >= 1.0 or (rate > 0.0 and random() < rate)
+
+def get_mode():
+    """Returns the (mode, rate) contract checking setting for this thread."""
+    return _mode.mode, _mode.rate
+
+def set_mode(mode, rate=None):
+    """
+    Set the process-wide contract checking mode.
+    
+    :param mode: :data:`FULL` checks every contract, :data:`SAMPLED` checks a
+        fraction of them and :data:`OFF` checks none.  Conditions applied as
+        decorators while checking is off return the function unchanged.
+    :param rate: The fraction of calls or assignments checked when sampling.
+    """
+    rate = _rate(mode, rate)
+    with _mode_lock:
+        _Mode.mode = mode
+        _Mode.rate = rate
+
+
+class contract_mode(object):
+    """
+    Context manager which sets the contract checking mode for the current
+    thread, taking the same arguments as :func:`set_mode`.
+    """
+
+    def __init__(self, mode, rate=None):
+        self.mode = mode
+        self.rate = _rate(mode, rate)
+        self.previous = []
+
+    def __enter__(self):
+        self.previous.append(dict(vars(_mode)))
+        _mode.mode = self.mode
+        _mode.rate = self.rate
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        overrides = vars(_mode)
+        overrides.clear()
+        overrides.update(self.previous.pop())
+
+
+def bind(obj, attr):
+    """
+    Returns a no argument callable which gets attribute `attr` of `obj`, for
+    use as the target of a condition.
+    """
+    getter = partial(getattr, obj, attr)
+    getter.__name__ = "%s.%s" % (type(obj).__name__, attr)
+    return getter
+
+def _checker(constraint):
+    """Return a function which checks whether values satisfy `constraint`."""
+    if isinstance(constraint, Constraints):
+        return constraint._check
+    if isinstance(constraint, CompactConstraints):
+        return constraint
+    return lambda value: isinstance(value, constraint)
+
+# The latest rejection in each thread by a check which records them, as
+# (id of the constraint args, id of the value, index of the rejecting
+# argument or None).  Ids are kept rather than the objects, so that rejected
+# values aren't kept alive; violations are raised straight after the check
+# which rejected them, so the ids can't have been reused in between.
+_rejections = local()
+
+def _rejected(args, value, index):
+    """Record that argument `index` of `args` rejected `value`; returns False."""
+    _rejections.last = (id(args), id(value), index)
+    return False
+
+def _rejection(constraint, value):
+    """
+    Returns the index of the argument of `constraint` which rejected `value`
+    in the latest check of it in this thread, if that was recorded.
+    """
+    last = getattr(_rejections, "last", None)
+    if (last is not None and last[1] == id(value) and
+            last[0] == id(getattr(constraint, "args", None))):
+        return last[2]
+    return None
+
+# Renders values in violation messages, abbreviating large ones.
+_repr = Repr()
+_repr.maxstring = _repr.maxother = 80
+_repr.maxlevel = 3
+
+
+class ConstraintViolation(AssertionError):
+    """
+    Raised when a value does not satisfy a constraint.  Holds the
+    `constraint` and the `value` itself; the message, which includes an
+    abbreviated repr of the value, is only rendered when the exception is
+    formatted.
+    
+    :attr:`index` and :attr:`expression` identify the first of the
+    constraint's arguments which rejects the value.  The index is recorded by
+    the check itself, or given as `index`.  Otherwise it is found when first
+    used by evaluating the leading Symbol arguments one at a time; other
+    callables are never called again, so the index is then None if one of
+    them comes first.
+    """
+
+    def __init__(self, constraint, value,
+                 template="The value (%s) does not satisfy the constraint",
+                 index=None):
+        super(ConstraintViolation, self).__init__(constraint, value)
+        self.constraint = constraint
+        self.value = value
+        # The message, with a %s for the value.
+        self.template = template
+        if index is None:
+            index = _rejection(constraint, value)
+        self._index = index
+
+    @property
+    def index(self):
+        """
+        The index of the constraint argument which rejects the value, or None
+        if it is unknown or the constraint has no arguments.
+        """
+        if self._index is None:
+            self._index = -1
+            for (index, arg) in enumerate(getattr(self.constraint, "args", ())):
+                if not isinstance(arg, Symbol):
+                    break
+                try:
+                    passed = arg.__compile__()(self.value)
+                except Exception:
+                    passed = False
+                if not passed:
+                    self._index = index
+                    break
+        return self._index if self._index >= 0 else None
+
+    @property
+    def expression(self):
+        """A description of the constraint argument which rejects the value."""
+        index = self.index
+        if index is None:
+            return None
+        return describe(self.constraint.args[index])
+
+    def __str__(self):
+        message = self.template % _repr.repr(self.value)
+        expression = self.expression
+        if expression is not None:
+            message = "%s: %s" % (message, expression)
+        return message
+
+    def __reduce__(self):
+        # Constraint classes can't be pickled, so only the message is.
+        return (AssertionError, (str(self),))
+
+# The wrappers generated by _contract.  Other decorators may copy the
+# __contracts__ attribute of the function they wrap, so it doesn't identify
+# them.
+_wrappers = WeakSet()
+
+def _contract(f, preconditions, postconditions):
+    """
+    Generate a single wrapper for `f` which checks all of `preconditions`, in
+    order, against its arguments and then all of `postconditions` against
+    its result.  The wrapper has the signature of `f`, and the position of
+    each constrained argument is resolved here rather than per call.  Calls
+    are passed straight through when the contract mode skips them.
+    """
+    spec = getargspec(f)
+    evaldict = {"_func_": f, "_mode_": _mode, "_random_": random}
+    lines = ["_rate_ = _mode_.rate",
+             "if _rate_ < 1.0 and not (_rate_ and _random_() < _rate_):",
+             "    return _func_(%(shortsignature)s)"]
+    for (index, condition) in enumerate(preconditions):
+        if condition.name in spec.args:
+            argument = condition.name
+        elif spec.keywords:
+            argument = "%s[%r]" % (spec.keywords, condition.name)
+        else:
+            raise TypeError("%s() has no argument named %r" %
+                            (f.__name__, condition.name))
+        evaldict["_pre%d_" % index] = condition.checker()
+        evaldict["_prefail%d_" % index] = condition.failure
+        lines.append("if not _pre%d_(%s):" % (index, argument))
+        lines.append("    raise _prefail%d_(%s)" % (index, argument))
+    if not postconditions:
+        lines.append("return _func_(%(shortsignature)s)")
+    elif isgeneratorfunction(f):
+        # Check the values the generator yields rather than the generator.
+        evaldict["_posts_"] = [(condition.checker(), condition.failure)
+                               for condition in postconditions]
+        evaldict["_checked_"] = _checked_generator
+        lines.append("return _checked_(_func_(%(shortsignature)s), _posts_)")
+    else:
+        lines.append("_result_ = _func_(%(shortsignature)s)")
+        for (index, condition) in enumerate(postconditions):
+            evaldict["_post%d_" % index] = condition.checker()
+            evaldict["_postfail%d_" % index] = condition.failure
+            lines.append("if not _post%d_(_result_):" % index)
+            lines.append("    raise _postfail%d_(_result_)" % index)
+        lines.append("return _result_")
+    wrapper = FunctionMaker.create(
+        f, "\n".join(lines), evaldict, __wrapped__=f,
+        __contracts__=(f, preconditions, postconditions))
+    _wrappers.add(wrapper)
+    return wrapper
+
+class _Tracking(local):
+
+    def __init__(self):
+        # Maps the ids of objects in calls to their methods checked by class
+        # invariants to the attributes written during the outermost call, or
+        # to None if invariants are not being checked for it.
+        self.objects = {}
+
+_tracking = _Tracking()
+
+class ClassInvariants(object):
+    """
+    The invariants of a class decorated with :class:`Invariant` conditions,
+    and the attributes each depends on.
+    """
+
+    def __init__(self, conditions=()):
+        self.conditions = []
+        # Indexes of the conditions which depend on each attribute, and of
+        # those which may depend on anything.
+        self.attributes = {}
+        self.unknown = []
+        for condition in conditions:
+            self.add(condition)
+
+    def add(self, condition):
+        index = len(self.conditions)
+        self.conditions.append(condition)
+        names = condition.attributes()
+        if names is None:
+            self.unknown.append(index)
+        for name in names or ():
+            self.attributes.setdefault(name, []).append(index)
+
+    def check(self, obj, written=None):
+        """
+        Check the invariants of `obj` which depend on the attributes in
+        `written`, or all of them if it is None.
+        """
+        if written is None:
+            conditions = self.conditions
+        else:
+            indexes = set(self.unknown)
+            for name in written:
+                indexes.update(self.attributes.get(name, ()))
+            conditions = [self.conditions[index] for index in sorted(indexes)]
+        for condition in conditions:
+            value = condition.value_of(obj)
+            if not condition.check(value):
+                raise condition.failure(value)
+
+def _tracked(function):
+    """
+    Wrap `function`, a __setattr__ or __delattr__ implementation, to record
+    the attribute names it is called with.
+    """
+    def tracked(self, name, *value):
+        written = _tracking.objects.get(id(self))
+        if written is not None:
+            written.add(name)
+        function(self, name, *value)
+    tracked.__name__ = function.__name__
+    tracked.__tracks_attributes__ = True
+    return tracked
+
+def _invariant_method(f, initializer):
+    """
+    Wrap the method `f` so that the outermost call to a method of an object
+    checks the invariants of its class which depend on the attributes
+    written during the call, or all of them for `initializer`.
+    """
+    evaldict = {"_func_": f, "_tracking_": _tracking, "_enabled_": _enabled}
+    obj = getargspec(f).args[0]
+    lines = ["_key_ = id(%s)" % obj,
+             "_tracked_ = _tracking_.objects",
+             "if _key_ in _tracked_:",
+             "    return _func_(%(shortsignature)s)",
+             "_written_ = _tracked_[_key_] = set() if _enabled_() else None",
+             "try:",
+             "    _result_ = _func_(%(shortsignature)s)",
+             "    if _written_ is not None:",
+             # Methods called by the invariants run unchecked.
+             "        _tracked_[_key_] = None",
+             "        type(%s).__invariants__.check(%s, %s)" %
+             (obj, obj, "None" if initializer else "_written_"),
+             "finally:",
+             "    del _tracked_[_key_]",
+             "return _result_"]
+    return FunctionMaker.create(f, "\n".join(lines), evaldict, __wrapped__=f,
+                                __checks_invariants__=True)
+
+def _invariant_class(cls, condition):
+    """Add the class invariant `condition` to `cls`, returning `cls`."""
+    invariants = vars(cls).get("__invariants__")
+    if invariants is not None:
+        if condition not in invariants.conditions:
+            invariants.add(condition)
+        return cls
+    inherited = getattr(cls, "__invariants__", None)
+    conditions = list(inherited.conditions) if inherited else []
+    if condition not in conditions:
+        conditions.append(condition)
+    cls.__invariants__ = ClassInvariants(conditions)
+    for name in ("__setattr__", "__delattr__"):
+        function = getattr(cls, name)
+        if not getattr(function, "__tracks_attributes__", False):
+            setattr(cls, name, _tracked(function))
+    for name in dir(cls):
+        if name.startswith("_") and name != "__init__":
+            continue
+        method = None
+        for class_ in cls.__mro__:
+            if name in vars(class_):
+                method = vars(class_)[name]
+                break
+        if (isinstance(method, FunctionType) and getargspec(method).args and
+                not getattr(method, "__checks_invariants__", False)):
+            setattr(cls, name, _invariant_method(method, name == "__init__"))
+    return cls
+
+def _checked_generator(generator, postconditions):
+    """
+    Yields the values of `generator`, checking each against
+    `postconditions`, a list of (check, failure) pairs.  Values sent and
+    exceptions thrown into this generator are passed on.
+    """
+    try:
+        value = next(generator)
+        while True:
+            for (check, failure) in postconditions:
+                if not check(value):
+                    raise failure(value)
+            try:
+                sent = yield value
+            except GeneratorExit:
+                raise
+            except BaseException:
+                value = generator.throw(*exc_info())
+            else:
+                value = generator.send(sent)
+    finally:
+        generator.close()
+
+def _compile_checks(compiler, args, intervals, owner=None, order=None):
+    """
+    Emit the statements checking `args` in order.  The arguments in
+    `intervals` are replaced by one test of their combined interval, at the
+    position of the first of them, so that it still guards the arguments
+    after that.  Moving the later interval tests forward is safe, as they are
+    plain integer comparisons.
+    
+    If `owner` is given, rejections are recorded for :class:`ConstraintViolation`
+    with the index in `owner` of the rejecting argument, which is its index
+    in `order` if given.  The combined interval test records no index.
+    """
+    if owner is not None:
+        compiler.namespace["_rejected_"] = _rejected
+        compiler.namespace["_owner_"] = owner
+    first = min(intervals) if intervals else None
+    for (index, arg) in enumerate(args):
+        if index in intervals:
+            if index != first:
+                continue
+            test = reduce(Interval.intersect, intervals.values()).source(
+                compiler.argument)
+            if test is None:
+                continue
+        elif isinstance(arg, Symbol):
+            test = compiler.expression(arg)
+        else:
+            test = "%s(%s)" % (compiler.constant(arg), compiler.argument)
+        if owner is None:
+            compiler.statement("if not %s: return False" % test)
+            continue
+        if index in intervals:
+            rejected = None
+        else:
+            rejected = order[index] if order is not None else index
+        compiler.statement("if not %s: return _rejected_(_owner_, %s, %r)" % (
+            test, compiler.argument, rejected))
+    compiler.statement("return True")
+
+def _compile_check(args, owner=None, order=None):
+    """
+    Compile constraint arguments into a single function that returns True iff
+    its argument satisfies all of them, checking them in order.  Symbol
+    subexpressions shared between arguments are evaluated once per check,
+    and for integers, affine comparisons are reduced to one interval test.
+    Rejections are recorded for `owner`, by default `args` (see
+    :func:`_compile_checks`).
+    """
+    if owner is None:
+        owner = args
+    compiler = Compiler()
+    compiler.share(args)
+    intervals = integer_intervals(args)
+    if intervals:
+        compiler.statement("if type(%s) in %s:" % (compiler.argument,
+                                                   compiler.constant(INTEGERS)))
+        compiler.indent += 1
+        _compile_checks(compiler, args, intervals, owner, order)
+        compiler.indent -= 1
+        compiler.forget()
+    _compile_checks(compiler, args, {}, owner, order)
+    return compiler.build("check")
+
+class _AdaptiveCheck(object):
+    """
+    Check function which samples the cost and rejection rate of each of its
+    predicates, and periodically recompiles itself so that the predicates
+    which are cheapest per rejection run first.
+    """
+
+    # Every `interval`-th check is timed, and predicates are reordered after
+    # every `period` timed checks.
+    interval = 64
+    period = 128
+
+    def __init__(self, args):
+        self.args = args
+        self.functions = [arg.__compile__() if isinstance(arg, Symbol) else arg
+                          for arg in args]
+        self.order = range(len(args))
+        self.check = _compile_check(args)
+        self.evaluated = [0] * len(args)
+        self.rejected = [0] * len(args)
+        self.cost = [0.0] * len(args)
+        self.calls = 0
+        self.samples = 0
+        self.lock = Lock()
+
+    def __call__(self, value):
+        self.calls += 1
+        if self.calls % self.interval:
+            return self.check(value)
+        passed = True
+        for index in self.order:
+            start = default_timer()
+            result = self.functions[index](value)
+            self.cost[index] += default_timer() - start
+            self.evaluated[index] += 1
+            if not result:
+                self.rejected[index] += 1
+                passed = _rejected(self.args, value, index)
+                break
+        self.samples += 1
+        if not self.samples % self.period:
+            self.reorder()
+        return passed
+
+    def reorder(self):
+        """Recompile the check with the predicates in order of cost per rejection."""
+        with self.lock:
+            def rank(index):
+                evaluated = self.evaluated[index]
+                if not evaluated:
+                    # Never reached, so there is nothing to go on.
+                    return (2, 0.0)
+                if not self.rejected[index]:
+                    return (1, self.cost[index] / evaluated)
+                return (0, self.cost[index] / self.rejected[index])
+            order = sorted(self.order, key=rank)
+            # Decay the statistics so the order can follow changes in traffic.
+            for index in order:
+                self.evaluated[index] //= 2
+                self.rejected[index] //= 2
+                self.cost[index] /= 2
+            if order != self.order:
+                self.check = _compile_check([self.args[i] for i in order],
+                                            self.args, order)
+                self.order = order
+
+class _MeteredCheck(object):
+    """
+    Check function which evaluates its predicates one at a time, recording
+    counts and timings for each in `metrics`.
+    """
+
+    def __init__(self, args, metrics):
+        self.args = args
+        self.functions = [arg.__compile__() if isinstance(arg, Symbol) else arg
+                          for arg in args]
+        self.metrics = metrics
+
+    def __call__(self, value):
+        results = []
+        passed = True
+        start = default_timer()
+        for (index, function) in enumerate(self.functions):
+            began = default_timer()
+            passed = bool(function(value))
+            results.append((index, passed, default_timer() - began))
+            if not passed:
+                _rejected(self.args, value, index)
+                break
+        self.metrics.record(passed, default_timer() - start, results)
+        return passed
+
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+# Marks cache keys for values cached by identity.
+_identity = object()
+
+class _CachedCheck(object):
+    """
+    Check function which remembers the results for the `maxsize` most
+    recently checked values.
+    
+    Values with a hash of their own, e.g. numbers, strings and tuples and
+    frozensets of them, are keyed by type and value, recursively for the
+    elements of tuples and frozensets, so that (1,) and (1.0,) are cached
+    separately.  Other values, including objects hashed by identity, are
+    only cached if `identity` is true and they support weak references,
+    keyed by identity, which is only correct if they are never mutated.
+    """
+
+    def __init__(self, check, maxsize, identity=False):
+        self.check = check
+        self.maxsize = maxsize
+        self.identity = identity
+        self.lock = Lock()
+        self.clear()
+
+    def clear(self):
+        """Empty the cache and reset the counters."""
+        with self.lock:
+            # Circular doubly linked list of [previous, next, key, result, ref]
+            # links, least recently used first.
+            self.root = root = []
+            root[:] = [root, root, None, None, None]
+            self.links = {}
+            self.hits = self.misses = 0
+
+    def __call__(self, value):
+        weak = None
+        try:
+            key = _key(value, identity=False)
+        except TypeError:
+            if not self.identity:
+                return self.check(value)
+            try:
+                weak = ref(value)
+            except TypeError:
+                return self.check(value)
+            key = (_identity, id(value))
+        with self.lock:
+            link = self.links.get(key)
+            if link is not None and (weak is None or link[4]() is value):
+                previous, next_, _, result, _ = link
+                previous[1] = next_
+                next_[0] = previous
+                last = self.root[0]
+                last[1] = self.root[0] = link
+                link[0] = last
+                link[1] = self.root
+                self.hits += 1
+                if not result:
+                    # The rejection isn't recorded again.
+                    _rejections.last = None
+                return result
+            self.misses += 1
+        result = self.check(value)
+        with self.lock:
+            link = self.links.pop(key, None)
+            if link is not None:
+                link[0][1] = link[1]
+                link[1][0] = link[0]
+            elif len(self.links) >= self.maxsize:
+                oldest = self.root[1]
+                oldest[0][1] = oldest[1]
+                oldest[1][0] = oldest[0]
+                del self.links[oldest[2]]
+            last = self.root[0]
+            link = [last, self.root, key, result, weak]
+            last[1] = self.root[0] = self.links[key] = link
+        return result
+
+    def cache_info(self):
+        """Report cache statistics."""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.links))
+
+def _vectorized(function, array):
+    """
+    Apply `function` to a whole array at once, returning a boolean array of
+    the same shape, or None if the result is not an elementwise truth value.
+    """
+    try:
+        with numpy.errstate(all="ignore"):
+            result = function(array)
+    except Exception:
+        return None
+    if (isinstance(result, numpy.ndarray) and result.shape == array.shape and
+            result.dtype.kind in "biufc"):
+        return result.astype(bool)
+    return None
+
+# Threads which run the predicates of acheck calls, created on first use.
+_threads = None
+_threads_lock = Lock()
+THREADS = 16
+
+def _thread_pool():
+    global _threads
+    with _threads_lock:
+        if _threads is None:
+            _threads = ThreadPool(THREADS)
+    return _threads
+
+def _call(function, value):
+    """Returns (True, function(value)), or (False, exception) if it raises."""
+    try:
+        return (True, function(value))
+    except Exception:
+        return (False, exc_info()[1])
+
+
+class PendingCheck(object):
+    """
+    The eventual result of :meth:`ConstraintBase.acheck`, with the methods of
+    a future.  Predicates are started as others finish, with at most
+    `concurrency` running at once, and no more are started once one fails.
+    Callbacks run in the thread pool.
+    """
+
+    def __init__(self, functions, value):
+        self._functions = iter(functions)
+        self._count = len(functions)
+        self._value = value
+        self._running = 0
+        self._lock = Lock()
+        self._event = Event()
+        self._outcome = None
+        self._callbacks = []
+
+    def _run(self, concurrency=None):
+        with self._lock:
+            for i in range(concurrency or self._count):
+                if not self._start():
+                    break
+            if not self._running:
+                self._finish((True, True))
+
+    def _start(self):
+        # Called with the lock held.
+        if self._outcome is not None:
+            return False
+        for function in self._functions:
+            self._running += 1
+            _thread_pool().apply_async(_call, (function, self._value),
+                                       callback=self._finished)
+            return True
+        return False
+
+    def _finished(self, outcome, started=True):
+        with self._lock:
+            if started:
+                self._running -= 1
+            if self._outcome is not None:
+                return
+            (returned, result) = outcome
+            if not returned or not result:
+                self._finish((returned, False if returned else result))
+            elif not self._start() and not self._running:
+                self._finish((True, True))
+
+    def _finish(self, outcome):
+        # Called with the lock held, so callbacks are run by the pool.
+        self._outcome = outcome
+        self._event.set()
+        callbacks = self._callbacks
+        self._callbacks = None
+        if callbacks:
+            _thread_pool().apply_async(self._run_callbacks, (callbacks,))
 
-def _frame_value(name):
-    # We have to break out of all the decorators in order to get the outer scope
-    frame = _getframe(3)
-    return frame.f_locals[name]
+    def _run_callbacks(self, callbacks):
+        for callback in callbacks:
+            callback(self)
+
+    def done(self):
+        """Returns True if the result is known."""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Returns True if the value satisfies the constraint, waiting up to
+        `timeout` seconds.  Raises the exception a predicate raised.
+        """
+        if not self._event.wait(timeout):
+            raise RuntimeError("Check did not finish in %s seconds" % timeout)
+        (returned, result) = self._outcome
+        if not returned:
+            raise result
+        return result
+
+    def add_done_callback(self, callback):
+        """Call `callback` with this object once the result is known."""
+        with self._lock:
+            if self._callbacks is not None:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+# The check of the constraint a validate_parallel worker process validates.
+_worker_check = None
+
+def _start_worker(args):
+    global _worker_check
+    _worker_check = _compile_check(args)
+
+def _check_chunk(chunk):
+    """Returns the indexes of the items of an (offset, items) chunk which fail."""
+    (offset, items) = chunk
+    check = _worker_check
+    return [offset + index for (index, item) in enumerate(items)
+            if not check(item)]
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    offset = 0
+    while True:
+        items = list(islice(iterator, size))
+        if not items:
+            return
+        yield (offset, items)
+        offset += len(items)
 
 class Constraints(ABCMeta):
     """
@@ -31,119 +814,489 @@ class Constraints(ABCMeta):
     no argument callables or Symbol expressions.
     
     isinstance(obj, ConstraintsInstance) will return True iff obj satisfies all
-    constraints.
+    constraints.  The constraints are compiled into a single function when the
+    class is created, so checks do not walk the Symbol expressions.  See
+    :class:`CompactConstraints` for a lighter weight alternative.
+    
+    Keyword options:
+    
+    * `adaptive` -- if true, the cost and rejection rate of each constraint
+      are sampled, and the constraints are periodically reordered so that
+      cheap, selective constraints run first.  Only use this when no
+      constraint relies on an earlier one to reject unsuitable values.
+    * `cache` -- the number of check results to remember.  Results are looked
+      up by value for values with a hash of their own, e.g. numbers, strings
+      and tuples of them, and evicted least recently used first.
+    * `cache_identity` -- if true, the results for other values which support
+      weak references, e.g. unhashable values and objects hashed by identity,
+      are also cached, by identity.  Only use this if such values are never
+      mutated.
+    * `metrics` -- if true, check counts and timings are recorded, in total
+      and for each constraint, in the class's `metrics` attribute (see
+      :mod:`constraints.metrics`).  A string value names the metrics.  With a
+      cache, only cache misses are recorded.
     """
 
-    def __init__(self, *args):
+    def __init__(self, *args, **options):
         pass
 
-    def __new__(self, *args):
+    def __new__(self, *args, **options):
+        adaptive = options.pop("adaptive", False)
+        cache = options.pop("cache", None)
+        cache_identity = options.pop("cache_identity", False)
+        metrics = options.pop("metrics", None)
+        if options:
+            raise TypeError("Unexpected keyword arguments: %s" %
+                            ", ".join(sorted(options)))
+        if metrics:
+            if adaptive:
+                raise TypeError("adaptive and metrics can't be combined")
+            predicates = [describe(arg) for arg in args]
+            if not isinstance(metrics, basestring):
+                metrics = "Constraints(%s)" % ", ".join(predicates)
+            metrics = Metrics(metrics, predicates)
+            check = _MeteredCheck(args, metrics)
+        elif adaptive:
+            check = _AdaptiveCheck(args)
+        else:
+            check = _compile_check(args)
+        if cache:
+            check = _CachedCheck(check, cache, cache_identity)
         return super(Constraints, self).__new__(
             self,
             "Constraint",
             (ConstraintBase,),
-            {"args":args}
+            {"args": args, "_check": staticmethod(check), "metrics": metrics}
         )
 
     def __instancecheck__(self, other):
-        # We need to replace the placeholder object with other
-        return all(
-            not isinstance(arg, Symbol) and arg(other) or \
-            arg.__evaluate__(other) for arg in self.args
-        )
+        return self._check(other)
 
 
+class CompactConstraints(object):
+    """
+    A lightweight alternative to :class:`Constraints` for applications which
+    build very many constraints: an object rather than a class, which is
+    called to check values and is only compiled when it is first called::
+    
+        positive = CompactConstraints(X > 0)
+        assert positive(1)
+    
+    Compact constraints can be used wherever a constraint is accepted, e.g.
+    with conditions, collection expressions and dispatchers.  For
+    isinstance checks or descriptors, :meth:`as_class` returns an equivalent
+    Constraints class.
+    """
+
+    __slots__ = ("args", "_check", "_class", "__weakref__")
+
+    def __init__(self, *args):
+        self.args = args
+        self._check = None
+        self._class = None
+
+    def __call__(self, value):
+        check = self._check
+        if check is None:
+            check = self._check = _compile_check(self.args)
+        return check(value)
+
+    def __reduce__(self):
+        # The compiled check can't be pickled, so it is made again.
+        return (CompactConstraints, self.args)
+
+    def as_class(self):
+        """Returns a Constraints class with the same arguments, made once."""
+        if self._class is None:
+            self._class = Constraints(*self.args)
+        return self._class
+
 class ConstraintBase(object):
-    """Constraint base class.  Constraints are usable as descriptors."""
+    """
+    Constraint base class.  Constraints are usable as descriptors, which store
+    their values on the instances of the owning class.
+    
+    Values are stored in the instance's __dict__ under the descriptor's
+    attribute name.  Instances of classes without a __dict__ use the slot
+    named `slot`, by default the attribute name prefixed with an underscore::
+    
+        class Point(object):
+            __slots__ = ("_x",)
+            x = SizeConstraint()
+    
+    The attribute name is found automatically, or can be passed as `name`.
+    """
 
-    def __init__(self, callable_=None, name=None):
-        if name is None and isinstance(callable, basestring):
+    # The constraint's Metrics, if it was created with metrics enabled.
+    metrics = None
+
+    def __init__(self, callable_=None, name=None, slot=None):
+        if name is None and isinstance(callable_, basestring):
             # If someone wants to pass name where callable should be, we are ok with that.
             (name, callable_) = (callable_, name)
         self.name = name
         self.callable = callable_
+        self.slot = slot
+        # Maps owner classes without a __dict__ to their slot descriptors.
+        self._slots = {}
+
+    def __set_name__(self, owner, name):
+        if self.name is None:
+            self.name = name
+
+    def _resolve(self, obj):
+        """
+        Find this descriptor's attribute name if it wasn't given, and return
+        the slot used for `obj`, or None if `obj` has a __dict__.
+        """
+        if self.name is None:
+            for class_ in type(obj).__mro__:
+                for (name, attribute) in vars(class_).items():
+                    if attribute is self:
+                        self.name = name
+                        break
+                if self.name is not None:
+                    break
+        if hasattr(obj, "__dict__"):
+            return None
+        slot = getattr(type(obj), self.slot or "_%s" % self.name, None)
+        if not isinstance(slot, MemberDescriptorType):
+            raise AttributeError("%r object has no __dict__ or %r slot" %
+                                 (type(obj).__name__,
+                                  self.slot or "_%s" % self.name))
+        self._slots[type(obj)] = slot
+        return slot
 
     def __get__(self, obj, type_=None):
-        return getattr(self, "value", None)
+        if obj is None:
+            return self
+        slot = self._slots.get(type(obj))
+        if slot is None:
+            try:
+                return obj.__dict__.get(self.name)
+            except AttributeError:
+                slot = self._resolve(obj)
+        try:
+            return slot.__get__(obj, type_)
+        except AttributeError:
+            return None
 
     def __set__(self, obj, value):
-        if isinstance(value, type(self)):
-            self.value = value
-        else:
-            raise AssertionError("Specified value (%s) does not satisfy this"
-                                 " constraint" % value)
+        rate = _mode.rate
+        if (rate >= 1.0 or rate and random() < rate) and not self._check(value):
+            raise ConstraintViolation(type(self), value, "Specified value (%s)"
+                                      " does not satisfy this constraint")
+        slot = self._slots.get(type(obj))
+        if slot is None:
+            if self.name is None or not hasattr(obj, "__dict__"):
+                slot = self._resolve(obj)
+            if slot is None:
+                obj.__dict__[self.name] = value
+                return
+        slot.__set__(obj, value)
 
     def __delete__(self, obj):
+        slot = self._slots.get(type(obj)) or self._resolve(obj)
         try:
-            del self.value
-        except AttributeError:
+            if slot is None:
+                del obj.__dict__[self.name]
+            else:
+                slot.__delete__(obj)
+        except (KeyError, AttributeError):
             pass
 
     @classmethod
-    def precondition(cls, callable_=None, name=None):
+    def precondition(cls, callable_=None, name=None, metrics=False, namespace=None):
         """
         Returns a Precondition instance.
         
         :param callable_: A no argument callable.
         :param name: The name of the variable to verify.
         :type name: string
+        :param metrics: If true, record check counts and timings.
+        :param namespace: A mapping to look `name` up in, rather than the
+            local variables of the block the condition is used in.
 
         .. note::
             
             `callable`, if specified, takes precedence over `name` in situations
             where either could be used.  If `name` is not specified and `callable`
-            is a string, `callable` will be used as `name`.
+            is a string, `callable` will be used as `name`.  Use :func:`bind`
+            to check an attribute.
         """
-        return Precondition(cls, callable_, name)
+        return Precondition(cls, callable_, name, metrics, namespace)
 
     @classmethod
-    def postcondition(cls, callable_=None, name=None):
+    def postcondition(cls, callable_=None, name=None, metrics=False, namespace=None):
         """
         Returns a Postcondition instance.
         
         :param callable_: A no argument callable.
         :param name: The name of the variable to verify.
         :type name: string
+        :param metrics: If true, record check counts and timings.
+        :param namespace: A mapping to look `name` up in, rather than the
+            local variables of the block the condition is used in.
 
         .. note::
             
             `callable`, if specified, takes precedence over `name` in situations
             where either could be used.  If `name` is not specified and `callable`
-            is a string, `callable` will be used as `name`.
+            is a string, `callable` will be used as `name`.  Use :func:`bind`
+            to check an attribute.
         """
-        return Postcondition(cls, callable_, name)
+        return Postcondition(cls, callable_, name, metrics, namespace)
 
     @classmethod
-    def invariant(cls, callable_=None, name=None):
+    def invariant(cls, callable_=None, name=None, metrics=False, namespace=None):
         """
         Returns an Invariant instance.
         
         :param callable_: A no argument callable.
         :param name: The name of the variable to verify.
         :type name: string
+        :param metrics: If true, record check counts and timings.
+        :param namespace: A mapping to look `name` up in, rather than the
+            local variables of the block the condition is used in.
 
         .. note::
             
             `callable`, if specified, takes precedence over `name` in situations
             where either could be used.  If `name` is not specified and `callable`
-            is a string, `callable` will be used as `name`.
+            is a string, `callable` will be used as `name`.  Use :func:`bind`
+            to check an attribute.
+        """
+        return Invariant(cls, callable_, name, metrics, namespace)
+
+    @classmethod
+    def mask(cls, array):
+        """
+        Returns a boolean array which is True where the corresponding element
+        of `array` satisfies this constraint.  Requires numpy.
+        
+        Symbol expressions are evaluated over the whole array at once using
+        numpy's elementwise operators.  Callables, and expressions that can't
+        be vectorized (e.g. ``X[-1] == "h"``), are evaluated element by element,
+        but only for elements that satisfied the preceding constraints.
+        """
+        if numpy is None:
+            raise ImportError("mask requires numpy")
+        array = numpy.asarray(array)
+        result = numpy.ones(array.shape, dtype=bool)
+        for arg in cls.args:
+            if isinstance(arg, Symbol):
+                function = arg.__compile__()
+                passed = _vectorized(function, array)
+                if passed is not None:
+                    result &= passed
+                    continue
+            else:
+                function = arg
+            remaining = array[result]
+            result[result] = numpy.fromiter(
+                (bool(function(value)) for value in remaining), bool,
+                len(remaining))
+        return result
+
+    @classmethod
+    def filter(cls, iterable):
+        """
+        Returns an iterator over the items of `iterable` which satisfy this
+        constraint.  Items are consumed lazily.
+        """
+        return ifilter(cls._check, iterable)
+
+    @classmethod
+    def partition(cls, iterable):
+        """
+        Returns a (valid, invalid) tuple of lists of the items of `iterable`.
+        """
+        check = cls._check
+        valid = []
+        invalid = []
+        for item in iterable:
+            (valid if check(item) else invalid).append(item)
+        return valid, invalid
+
+    @classmethod
+    def count_valid(cls, iterable):
+        """Returns the number of items of `iterable` which satisfy this constraint."""
+        return sum(imap(cls._check, iterable))
+
+    @classmethod
+    def first_invalid(cls, iterable):
+        """
+        Returns an (index, item) tuple for the first item of `iterable` which
+        does not satisfy this constraint, or None if every item does.  Stops
+        consuming `iterable` at the first failure.
+        """
+        check = cls._check
+        for index, item in enumerate(iterable):
+            if not check(item):
+                return index, item
+        return None
+
+    @classmethod
+    def acheck(cls, value, concurrency=None):
+        """
+        Starts checking `value` against this constraint without blocking,
+        returning a :class:`PendingCheck`.  Symbol expressions, which are
+        cheap, are evaluated first by the caller; the remaining callables run
+        in a shared pool of :data:`THREADS` threads, at most `concurrency` of
+        them at once (by default, all of them).
+        
+        Use this for predicates which wait on I/O, such as lookups in a cache
+        service, when they don't rely on each other to reject unsuitable
+        values.
+        """
+        pending = PendingCheck([arg for arg in cls.args
+                                if not isinstance(arg, Symbol)], value)
+        for arg in cls.args:
+            if isinstance(arg, Symbol):
+                outcome = _call(arg.__evaluate__, value)
+                if not outcome[0] or not outcome[1]:
+                    pending._finished(outcome, started=False)
+                    return pending
+        pending._run(concurrency)
+        return pending
+
+    @classmethod
+    def validate_parallel(cls, iterable, workers=None, chunksize=1000):
+        """
+        Returns a sorted list of the indexes of the items of `iterable` which
+        do not satisfy this constraint, checking chunks of `chunksize` items
+        in a pool of `workers` processes (by default, one per CPU).
+        
+        The constraint arguments are pickled to the workers once, so callable
+        arguments must be picklable, i.e. defined at module level.  Symbol
+        expressions are, unless they apply a Constraints class to elements
+        (e.g. with :func:`~constraints.util.Each`), as Constraints classes
+        can't be pickled; use a type or a :class:`CompactConstraints` there
+        instead.  The items are pickled too.  Per-class options such as caches
+        and metrics are not used by the workers.
+        """
+        pool = Pool(workers, _start_worker, (cls.args,))
+        try:
+            invalid = []
+            for indexes in pool.imap(_check_chunk, _chunks(iterable, chunksize)):
+                invalid.extend(indexes)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        return invalid
+
+    @classmethod
+    def cache_info(cls):
+        """
+        Returns a CacheInfo(hits, misses, maxsize, currsize) tuple for this
+        constraint's result cache, or None if it was created without one.
         """
-        return Invariant(cls, callable_, name)
+        cache_info = getattr(cls._check, "cache_info", None)
+        return cache_info and cache_info()
+
+    @classmethod
+    def cache_clear(cls):
+        """Empty this constraint's result cache, if it has one."""
+        clear = getattr(cls._check, "clear", None)
+        if clear is not None:
+            clear()
+
+
+class _Frames(local):
+
+    def __init__(self):
+        self.stack = []
 
 
 class ConditionBase(object):
     """Base class for design by contract style conditions."""
 
-    def __init__(self, constraint, target=None, name=None):
+    # Describes the condition in failure messages.
+    description = "condition"
+
+    def __init__(self, constraint, target=None, name=None, metrics=False,
+                 namespace=None):
         self.constraint = constraint
         if name is None and isinstance(target, basestring):
             # If someone wants to pass name where callable should be, we are ok with that.
             (name, target) = (target, name)
         self.target = target
         self.name = name
+        self.namespace = namespace
+        if target is None and namespace is None:
+            # The frames of the blocks this condition is being used in.
+            self._frames = _Frames()
+        self._check = _checker(constraint)
+        self.metrics = None
+        if metrics:
+            self.metrics = Metrics("%s %s" % (self.description,
+                                              name or describe(target)))
+
+    def checker(self):
+        """
+        Returns the fastest function which checks values against this
+        condition, recording metrics if they are enabled.
+        """
+        return self._check if self.metrics is None else self.check
+
+    def check(self, value):
+        """
+        Returns True if `value` meets this condition, recording the check if
+        metrics are enabled.
+        """
+        if self.metrics is None:
+            return self._check(value)
+        start = default_timer()
+        passed = self._check(value)
+        self.metrics.record(passed, default_timer() - start)
+        return passed
 
     def __call__(self, f):
-        return decorator(self.decorator, f)
+        """
+        Decorate `f`.  Applying a condition to a function which is already
+        wrapped by conditions replaces the wrapper with a single new one that
+        checks all of them, so stacked conditions cost one call layer.  If
+        contract checking is off, `f` is returned unchanged.
+        """
+        if _mode.rate <= 0.0:
+            return f
+        (f, preconditions, postconditions) = \
+            f.__contracts__ if f in _wrappers else (f, (), ())
+        return _contract(f, *self.combine(preconditions, postconditions))
+
+    def combine(self, preconditions, postconditions):
+        """
+        Returns (preconditions, postconditions) with this condition added as the
+        outermost.
+        """
+        raise NotImplementedError
+
+    def value(self, frame=None):
+        """
+        Returns the value to check: the result of the target, or the value of
+        the named variable in the namespace or in `frame`.
+        """
+        if self.target is not None:
+            return self.target()
+        if self.namespace is not None:
+            return self.namespace[self.name]
+        return frame.f_locals[self.name]
+
+    def _enter(self, frame):
+        # Remember the frame of the block until it exits.
+        if self.target is None and self.namespace is None:
+            self._frames.stack.append(frame)
+
+    def _exit(self):
+        if self.target is None and self.namespace is None:
+            return self._frames.stack.pop()
+        return None
+
+    def failure(self, value):
+        """Returns the exception raised when `value` does not meet this condition."""
+        return ConstraintViolation(self.constraint, value, "The value (%%s) did"
+                                   " not meet the specified %s" % self.description)
 
     def __enter__(self):
         pass
@@ -163,23 +1316,19 @@ class Precondition(ConditionBase):
         will not function properly.
     """
 
-    def __enter__(self):
-        value = (getattr(self, "target", None) or (lambda: _frame_value(self.name)))()
-        if not isinstance(value, self.constraint):
-            raise AssertionError("The value (%s) did not meet the specified"
-                                 " pre-condition" % value)
+    description = "pre-condition"
 
-    def decorator(self, f, *args, **kwargs):
-        """
-        Precondition decorator, looks at the bound value of the arg with the
-        key equal to self.name.
-        """
-        arg_values = getcallargs(f, *args, **kwargs)
-        arg = arg_values[self.name]
-        if not isinstance(arg, self.constraint):
-            raise AssertionError("The value (%s) did not meet the specified"
-                                 " pre-condition" % arg)
-        return f(*args, **kwargs)
+    def combine(self, preconditions, postconditions):
+        # The outermost precondition is checked first.
+        return (self,) + preconditions, postconditions
+
+    def __enter__(self):
+        if not _enabled():
+            return
+        value = self.value(_getframe(1) if self.target is None and
+                           self.namespace is None else None)
+        if not self.check(value):
+            raise self.failure(value)
 
 
 class Postcondition(ConditionBase):
@@ -193,41 +1342,92 @@ class Postcondition(ConditionBase):
         ignores the callable and name attributes of the condition if they are present.
     """
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        value = (getattr(self, "target", None) or (lambda: _frame_value(self.name)))()
-        if not isinstance(value, self.constraint):
-            raise AssertionError("The value (%s) did not meet the specified"
-                                 " post-condition" % value)
+    description = "post-condition"
 
-    def decorator(self, f, *args, **kwargs):
-        """
-        Postcondition decorator, looks at the result of the function call and
-        verify that it is satisfies the constraint condition.
-        """
-        result = f(*args, **kwargs)
-        if not isinstance(result, self.constraint):
-            raise AssertionError("The value (%s) did not meet the specified"
-                                 " post-condition" % result)
-        return result
+    def combine(self, preconditions, postconditions):
+        # The outermost postcondition is checked last.
+        return preconditions, postconditions + (self,)
+
+    def __enter__(self):
+        self._enter(_getframe(1))
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        frame = self._exit()
+        if not _enabled():
+            return
+        value = self.value(frame)
+        if not self.check(value):
+            raise self.failure(value)
 
 
 class Invariant(ConditionBase):
     """
     Constraint container that verifies an invariant condition.  Usable as a
-    context manager.
+    context manager or class decorator.
     """
 
+    description = "invariant condition"
+
     def __enter__(self):
-        value = (getattr(self, "target", None) or (lambda: _frame_value(self.name)))()
-        if not isinstance(value, self.constraint):
-            raise AssertionError("The value (%s) did not meet the specified"
-                                 " invariant condition" % value)
+        frame = _getframe(1)
+        if _enabled():
+            value = self.value(frame)
+            if not self.check(value):
+                raise self.failure(value)
+        self._enter(frame)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        value = (getattr(self, "target", None) or (lambda: _frame_value(self.name)))()
-        if not isinstance(value, self.constraint):
-            raise AssertionError("The value (%s) did not meet the specified"
-                                 " invariant condition" % value)
+        frame = self._exit()
+        if not _enabled():
+            return
+        value = self.value(frame)
+        if not self.check(value):
+            raise self.failure(value)
 
-    def __call__(self, f):
-        raise NotImplementedError("Invariant objects do not provide decorator functionality")
+    def attributes(self):
+        """
+        Returns the names of the attributes of an object that this condition
+        depends on as a class invariant, or None if they are unknown.
+        """
+        if self.target is not None:
+            return None
+        if self.name is not None:
+            return set([self.name])
+        args = getattr(self.constraint, "args", None)
+        if not args or not all(isinstance(arg, Symbol) for arg in args):
+            return None
+        return attributes(*args)
+
+    def value_of(self, obj):
+        """Returns the value to check as an invariant of `obj`."""
+        if self.target is not None:
+            return self.target(obj)
+        if self.name is not None:
+            return getattr(obj, self.name)
+        return obj
+
+    def __call__(self, cls):
+        """
+        Decorate `cls`, checking this condition as a class invariant after
+        its instances are initialized and after each call to a public method.
+        The condition checks the attribute `name`, the result of calling
+        `callable` with the instance, or if neither is given, the instance
+        itself, e.g. ``Constraints(X.low <= X.high).invariant()``.
+        
+        Only the outermost method call on an object is checked, and only the
+        invariants which depend on the attributes assigned or deleted during
+        it.  Invariants depend on their `name`, or on the attributes their
+        Symbol expressions read; ones using a callable, or calling methods of
+        the instance, are always checked.  Changes to mutable attribute values
+        in place, and assignments made outside method calls, are not tracked.
+        
+        Subclasses inherit the invariant, but public methods they add or
+        override are only checked if the subclass is decorated with the
+        condition too, which doesn't check it twice.  If contract checking is
+        off, `cls` is returned unchanged.
+        """
+        if not isclass(cls):
+            raise NotImplementedError("Invariant objects can only decorate classes")
+        if _mode.rate <= 0.0:
+            return cls
+        return _invariant_class(cls, self)
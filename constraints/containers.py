@@ -0,0 +1,264 @@
+"""
+containers provides list and dict types which validate their elements as they
+are added, rather than rescanning the whole container after each change::
+
+    buffer = ConstrainedList(SizeConstraint, aggregate=Constraints(X.len <= 1000))
+    buffer.append(3)
+
+Only the elements an operation adds are checked against the element
+constraint.  The optional aggregate constraint is checked against an
+:class:`Aggregates` object holding the running length, sum, minimum and
+maximum of the elements, so it costs the same however large the container
+grows.  An operation which would break either constraint raises
+:class:`~constraints.constraints.ConstraintViolation` and leaves the container unchanged.  Like descriptor
+assignments, checks follow the contract mode (see
+:func:`constraints.constraints.set_mode`).
+"""
+
+from collections import Counter
+from copy import copy
+from random import random
+from proxy import Symbol, attributes
+from constraints import ConstraintViolation, _checker, _mode, _rejection
+
+
+class Aggregates(object):
+    """
+    Running aggregates of the elements of a container: `len`, `sum`, `min`
+    and `max`.  `min` and `max` are None for an empty container.
+
+    Only the aggregates an aggregate constraint reads are maintained, when
+    they can be determined from its Symbol expressions.  Otherwise all of
+    them are maintained until the elements don't support one, e.g. `sum` for
+    strings, after which it is None.  Removing the minimum or maximum element
+    rescans the container to find the new one.
+    """
+
+    def __init__(self, elements, names=None):
+        # Returns an iterable of the elements of the container.
+        self._elements = elements
+        # Whether unsupported aggregates are dropped rather than raising.
+        self._optional = names is None
+        self._sums = names is None or "sum" in names
+        self._extremes = names is None or "min" in names or "max" in names
+        self.restore((0, 0, None, None))
+
+    def __repr__(self):
+        return "Aggregates(len=%r, sum=%r, min=%r, max=%r)" % (
+            self.len, self.sum, self.min, self.max)
+
+    def save(self):
+        """Returns the state of the aggregates, for :meth:`restore`."""
+        return (self.len, self.sum, self.min, self.max)
+
+    def restore(self, state):
+        (self.len, self.sum, self.min, self.max) = state
+        if not self._sums:
+            self.sum = None
+        if not self._extremes:
+            self.min = self.max = None
+
+    def _rescan(self, added, removed):
+        # Find the extremes of the elements, less `removed`, plus `added`.
+        # The removed elements are skipped by identity, so they needn't be
+        # hashable.
+        skipped = Counter(map(id, removed))
+        (low, high) = (min(added), max(added)) if added else (None, None)
+        for element in self._elements():
+            if skipped[id(element)]:
+                skipped[id(element)] -= 1
+            elif low is None:
+                low = high = element
+            elif element < low:
+                low = element
+            elif element > high:
+                high = element
+        (self.min, self.max) = (low, high)
+
+    def update(self, added, removed=()):
+        """
+        Account for the elements `added` to and `removed` from the container,
+        before the container is changed.
+        """
+        self.len += len(added) - len(removed)
+        if self._sums:
+            try:
+                self.sum += sum(added) - sum(removed)
+            except TypeError:
+                if not self._optional:
+                    raise
+                self._sums = False
+                self.sum = None
+        if not self._extremes:
+            return
+        try:
+            self._update_extremes(added, removed)
+        except TypeError:
+            if not self._optional:
+                raise
+            self._extremes = False
+            self.min = self.max = None
+
+    def _update_extremes(self, added, removed):
+        if not self.len:
+            self.min = self.max = None
+        elif removed and (min(removed) <= self.min or max(removed) >= self.max):
+            self._rescan(added, removed)
+        elif added:
+            low, high = min(added), max(added)
+            if self.min is None or low < self.min:
+                self.min = low
+            if self.max is None or high > self.max:
+                self.max = high
+
+
+class _Constrained(object):
+    """Validation shared by the constrained container types."""
+
+    def _setup(self, constraint, aggregate):
+        self.constraint = constraint
+        self.aggregate = aggregate
+        self._check = _checker(constraint)
+        self.aggregates = None
+        if aggregate is not None:
+            self._check_aggregates = _checker(aggregate)
+            args = getattr(aggregate, "args", None)
+            names = None
+            if args and all(isinstance(arg, Symbol) for arg in args):
+                names = attributes(*args)
+            self.aggregates = Aggregates(self._elements, names)
+
+    def _change(self, added, removed, operation, *args):
+        """
+        Validate the elements `added` by calling `operation` with `args`,
+        which also removes the elements `removed`, and call it.
+        """
+        rate = _mode.rate
+        checking = rate >= 1.0 or rate and random() < rate
+        if checking:
+            check = self._check
+            for element in added:
+                if not check(element):
+                    raise ConstraintViolation(self.constraint, element,
+                                              "Element (%s) does not satisfy"
+                                              " this constraint")
+        aggregates = self.aggregates
+        if aggregates is None:
+            return operation(self, *args)
+        state = aggregates.save()
+        try:
+            aggregates.update(added, removed)
+            if checking and not self._check_aggregates(aggregates):
+                raise ConstraintViolation(self.aggregate, copy(aggregates),
+                                          "%s do not satisfy the aggregate"
+                                          " constraint",
+                                          _rejection(self.aggregate, aggregates))
+            return operation(self, *args)
+        except:
+            aggregates.restore(state)
+            raise
+
+
+class ConstrainedList(_Constrained, list):
+    """
+    List whose elements satisfy `constraint`, and whose :class:`Aggregates`
+    satisfy `aggregate`, if given.
+    """
+
+    def __init__(self, constraint, iterable=(), aggregate=None):
+        list.__init__(self)
+        self._setup(constraint, aggregate)
+        self.extend(iterable)
+
+    def _elements(self):
+        return self
+
+    def append(self, value):
+        self._change((value,), (), list.append, value)
+
+    def extend(self, iterable):
+        values = list(iterable)
+        self._change(values, (), list.extend, values)
+
+    def __iadd__(self, iterable):
+        self.extend(iterable)
+        return self
+
+    def __imul__(self, n):
+        self._change(list(self) * (max(n, 1) - 1),
+                     list(self) if n <= 0 else (), list.__imul__, n)
+        return self
+
+    def insert(self, index, value):
+        self._change((value,), (), list.insert, index, value)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            self._change(value, self[index], list.__setitem__, index, value)
+        else:
+            self._change((value,), (self[index],), list.__setitem__, index, value)
+
+    def __setslice__(self, i, j, iterable):
+        self.__setitem__(slice(max(i, 0), max(j, 0)), iterable)
+
+    def __delitem__(self, index):
+        removed = self[index] if isinstance(index, slice) else (self[index],)
+        self._change((), removed, list.__delitem__, index)
+
+    def __delslice__(self, i, j):
+        self.__delitem__(slice(max(i, 0), max(j, 0)))
+
+    def pop(self, index=-1):
+        return self._change((), (self[index],), list.pop, index)
+
+    def remove(self, value):
+        self._change((), (self[self.index(value)],), list.remove, value)
+
+
+class ConstrainedDict(_Constrained, dict):
+    """
+    Dict whose values satisfy `constraint`, and whose values'
+    :class:`Aggregates` satisfy `aggregate`, if given.
+    """
+
+    def __init__(self, constraint, *args, **kwargs):
+        aggregate = kwargs.pop("aggregate", None)
+        dict.__init__(self)
+        self._setup(constraint, aggregate)
+        self.update(*args, **kwargs)
+
+    def _elements(self):
+        return self.itervalues()
+
+    def __setitem__(self, key, value):
+        removed = (self[key],) if key in self else ()
+        self._change((value,), removed, dict.__setitem__, key, value)
+
+    def update(self, *args, **kwargs):
+        items = dict(*args, **kwargs)
+        removed = [self[key] for key in items if key in self]
+        self._change(items.values(), removed, dict.update, items)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def __delitem__(self, key):
+        self._change((), (self[key],), dict.__delitem__, key)
+
+    def pop(self, key, *default):
+        if key not in self:
+            return dict.pop(self, key, *default)
+        return self._change((), (self[key],), dict.pop, key)
+
+    def popitem(self):
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+        key = next(self.iterkeys())
+        return (key, self.pop(key))
+
+    def clear(self):
+        self._change((), self.values(), dict.clear)
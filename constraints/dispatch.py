@@ -0,0 +1,242 @@
+"""
+dispatch provides :class:`ConstraintDispatcher`, which finds the constraint
+classes a value satisfies among many registered ones without checking each
+in turn.
+"""
+
+from bisect import bisect_right
+from proxy import Symbol, Compiler, _operands
+from optimizer import INTEGERS, interval
+from constraints import _compile_checks, _checker
+
+
+class _MemoCompiler(Compiler):
+    """
+    Compiler for functions taking a memo dict as well as the value, in which
+    the Symbols in `memoized` are stored under the given keys, so that
+    functions compiled for different constraints evaluate them once between
+    them.
+    """
+
+    def __init__(self, memoized):
+        super(_MemoCompiler, self).__init__(parameters=["_m"])
+        self.memoized = memoized
+
+    def computed(self, symbol, source):
+        key = self.memoized.get(id(symbol))
+        if key is not None:
+            source = "(_m[%d] if %d in _m else _m.setdefault(%d, %s))" % (
+                key, key, key, source)
+        return super(_MemoCompiler, self).computed(symbol, source)
+
+def _nodes(args):
+    """Returns the ids of the non-root Symbols computed by `args`."""
+    nodes = set()
+    pending = [arg for arg in args if isinstance(arg, Symbol)]
+    while pending:
+        symbol = pending.pop()
+        if symbol.parent is None or id(symbol) in nodes:
+            continue
+        nodes.add(id(symbol))
+        pending.extend(_operands(symbol))
+    return nodes
+
+def _equality(arg):
+    """Returns k if `arg` is ``X == k`` for a root Symbol X and hashable k."""
+    if (isinstance(arg, Symbol) and arg._op == "__eq__" and
+            arg.parent.parent is None and not isinstance(arg._args[0], Symbol)):
+        try:
+            hash(arg._args[0])
+        except TypeError:
+            return None
+        return arg._args
+    return None
+
+
+class _Entry(object):
+    """A registered constraint and how it is indexed."""
+
+    def __init__(self, order, constraint, handler):
+        self.order = order
+        self.constraint = constraint
+        self.handler = handler
+        self.args = getattr(constraint, "args", None)
+        self.interval = None
+        self.key = None
+        # Arguments not covered by the index.
+        self.residual = None
+        if self.args is None:
+            return
+        intervals = dict((index, interval(arg))
+                         for (index, arg) in enumerate(self.args))
+        intervals = dict((i, v) for (i, v) in intervals.items() if v is not None)
+        if intervals:
+            self.interval = reduce(lambda a, b: a.intersect(b), intervals.values())
+            self.residual = [arg for (index, arg) in enumerate(self.args)
+                             if index not in intervals]
+            return
+        for (index, arg) in enumerate(self.args):
+            key = _equality(arg)
+            if key is not None:
+                self.key = key[0]
+                self.residual = self.args[:index] + self.args[index + 1:]
+                return
+
+    def compile(self, memoized):
+        """Compile the full and residual checks of this entry."""
+        if self.args is None:
+            check = _checker(self.constraint)
+            self.check = self.rest = lambda value, memo: check(value)
+            return
+        self.check = self._compile(self.args, memoized)
+        if self.residual is not None:
+            excluded = self.interval.excluded if self.interval else ()
+            self.rest = self._compile(self.residual, memoized, excluded)
+
+    @staticmethod
+    def _compile(args, memoized, excluded=()):
+        compiler = _MemoCompiler(memoized)
+        compiler.share(args)
+        if excluded:
+            compiler.statement("if %s in %s: return False" % (
+                compiler.argument, compiler.constant(frozenset(excluded))))
+        _compile_checks(compiler, args, {})
+        return compiler.build("check")
+
+
+class ConstraintDispatcher(object):
+    """
+    Registry of constraint classes which finds the ones a value satisfies.
+
+    Registered constraints are compiled into a shared decision structure:
+
+    * Integers are looked up in an index of the intervals defined by affine
+      comparisons such as ``X * 2 + 1 >= 5`` (see :mod:`constraints.optimizer`).
+    * Hashable values are looked up in a dict of the constants of equality
+      constraints such as ``X == "GET"``.
+    * Only the remaining arguments of the constraints found this way, and of
+      constraints which can't be indexed, are evaluated, and subexpressions
+      they share are evaluated once per lookup.
+
+    Constraints are evaluated from their args, so per-class options such as
+    caches and metrics are bypassed.  Equality lookups assume that values'
+    hashes are consistent with ==.
+
+    Constraints can be registered with a handler, which :meth:`__call__`
+    dispatches to::
+
+        dispatcher = ConstraintDispatcher()
+
+        @dispatcher.register(Constraints(X < 0))
+        def negative(value):
+            ...
+    """
+
+    def __init__(self, constraints=()):
+        self._entries = []
+        self._compiled = False
+        for constraint in constraints:
+            self.register(constraint)
+
+    def register(self, constraint, handler=None):
+        """
+        Register `constraint`, with an optional `handler`.  If no handler is
+        given, returns a decorator which registers the function it decorates.
+        """
+        entry = _Entry(len(self._entries), constraint, handler)
+        self._entries.append(entry)
+        self._compiled = False
+        if handler is None:
+            def register_handler(handler):
+                entry.handler = handler
+                return handler
+            return register_handler
+        return handler
+
+    def _compile(self):
+        entries = self._entries
+        counts = {}
+        for entry in entries:
+            if entry.args is not None:
+                for node in _nodes(entry.args):
+                    counts[node] = counts.get(node, 0) + 1
+        memoized = dict((node, key) for (key, node) in
+                        enumerate(n for (n, c) in counts.items() if c > 1))
+        for entry in entries:
+            entry.compile(memoized)
+        self._unindexed = [e for e in entries if e.residual is None]
+        self._keyed = [e for e in entries if e.key is not None]
+        self._keys = {}
+        for entry in self._keyed:
+            self._keys.setdefault(entry.key, []).append(entry)
+        # Non-integers are checked against all of these; integers only
+        # against the ones in their segment, so empty intervals are left out.
+        self._ranged = [e for e in entries if e.interval is not None]
+        indexed = [e for e in self._ranged if not e.interval.empty]
+        # Segment i of the number line is [bounds[i - 1], bounds[i]).
+        bounds = set()
+        for entry in indexed:
+            if entry.interval.lo is not None:
+                bounds.add(entry.interval.lo)
+            if entry.interval.hi is not None:
+                bounds.add(entry.interval.hi + 1)
+        self._bounds = sorted(bounds)
+        self._segments = []
+        for segment in range(len(self._bounds) + 1):
+            lo = self._bounds[segment - 1] if segment else None
+            hi = self._bounds[segment] if segment < len(self._bounds) else None
+            self._segments.append([
+                e for e in indexed
+                if (e.interval.lo is None or
+                    lo is not None and e.interval.lo <= lo) and
+                (e.interval.hi is None or
+                 hi is not None and hi <= e.interval.hi + 1)])
+        self._compiled = True
+
+    def _candidates(self, value):
+        """Returns (entry, check) pairs to evaluate, in registration order."""
+        if not self._compiled:
+            self._compile()
+        candidates = [(e, e.check) for e in self._unindexed]
+        try:
+            candidates.extend((e, e.rest) for e in self._keys.get(value, ()))
+        except TypeError:
+            candidates.extend((e, e.check) for e in self._keyed)
+        if type(value) in INTEGERS:
+            segment = self._segments[bisect_right(self._bounds, value)]
+            candidates.extend((e, e.rest) for e in segment)
+        else:
+            candidates.extend((e, e.check) for e in self._ranged)
+        candidates.sort(key=lambda candidate: candidate[0].order)
+        return candidates
+
+    def matching(self, value):
+        """Returns the registered constraints `value` satisfies, in order."""
+        memo = {}
+        return [entry.constraint for (entry, check) in self._candidates(value)
+                if check(value, memo)]
+
+    def _first(self, value):
+        memo = {}
+        for (entry, check) in self._candidates(value):
+            if check(value, memo):
+                return entry
+        return None
+
+    def first(self, value):
+        """
+        Returns the first registered constraint `value` satisfies, or None.
+        """
+        entry = self._first(value)
+        return entry and entry.constraint
+
+    def __call__(self, value, *args, **kwargs):
+        """
+        Call the handler of the first registered constraint `value` satisfies
+        with `value` and any further arguments.  Raises LookupError if there
+        is none.
+        """
+        entry = self._first(value)
+        if entry is None or entry.handler is None:
+            raise LookupError("No handler for %r" % (value,))
+        return entry.handler(value, *args, **kwargs)
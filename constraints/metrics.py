@@ -0,0 +1,116 @@
+"""
+metrics provides opt-in instrumentation for constraints and conditions.
+
+Constraint classes created with ``Constraints(..., metrics=True)`` and
+conditions created with ``metrics=True`` record how many values they checked,
+passed and rejected, how long the checks took, and (for constraints) which
+predicate rejected each value.  :func:`snapshot` collects the figures for
+everything that is instrumented, for export to a monitoring system.
+"""
+
+from math import frexp
+from threading import Lock
+from weakref import WeakSet
+
+# Every live Metrics object, so they can be exported together.
+_registry = WeakSet()
+
+class Histogram(object):
+    """
+    Latency histogram with logarithmic buckets.  Bucket i counts durations
+    up to ``resolution * 2 ** i`` seconds.
+    """
+
+    resolution = 1e-7
+    buckets = 40
+
+    def __init__(self):
+        self.counts = [0] * self.buckets
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        """Record a duration, in seconds."""
+        bucket = frexp(seconds / self.resolution)[1]
+        self.counts[min(max(bucket, 0), self.buckets - 1)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, percent):
+        """
+        Returns an upper bound on the given percentile of the recorded
+        durations, or None if nothing has been recorded.
+        """
+        if not self.count:
+            return None
+        remaining = self.count * percent / 100.0
+        for (bucket, count) in enumerate(self.counts):
+            remaining -= count
+            if remaining <= 0:
+                break
+        return self.resolution * 2 ** bucket
+
+
+class Counter(object):
+    """Check, pass and failure counts and a latency histogram."""
+
+    percentiles = (50, 90, 99)
+
+    def __init__(self, name):
+        self.name = name
+        self.checks = self.passes = self.failures = 0
+        self.latency = Histogram()
+
+    def add(self, passed, seconds):
+        self.checks += 1
+        if passed:
+            self.passes += 1
+        else:
+            self.failures += 1
+        self.latency.add(seconds)
+
+    def snapshot(self):
+        """Returns the counts and timings as a dict."""
+        result = {
+            "name": self.name,
+            "checks": self.checks,
+            "passes": self.passes,
+            "failures": self.failures,
+            "time": self.latency.total,
+        }
+        for percent in self.percentiles:
+            result["p%d" % percent] = self.latency.percentile(percent)
+        return result
+
+
+class Metrics(Counter):
+    """
+    Metrics for a constraint or condition, with a :class:`Counter` for each of
+    its predicates.  A predicate's failures are the rejections it caused.
+    """
+
+    def __init__(self, name, predicates=()):
+        super(Metrics, self).__init__(name)
+        self.predicates = [Counter(predicate) for predicate in predicates]
+        self.lock = Lock()
+        _registry.add(self)
+
+    def record(self, passed, seconds, predicates=()):
+        """
+        Record a check taking `seconds`, with `predicates` the (index,
+        passed, seconds) results of the individual predicates evaluated.
+        """
+        with self.lock:
+            self.add(passed, seconds)
+            for (index, predicate_passed, predicate_seconds) in predicates:
+                self.predicates[index].add(predicate_passed, predicate_seconds)
+
+    def snapshot(self):
+        with self.lock:
+            result = super(Metrics, self).snapshot()
+            result["predicates"] = [p.snapshot() for p in self.predicates]
+        return result
+
+def snapshot():
+    """Returns snapshots of all live instrumented constraints and conditions."""
+    return [metrics.snapshot() for metrics in list(_registry)]
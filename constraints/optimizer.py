@@ -0,0 +1,167 @@
+"""
+optimizer simplifies Symbol expressions before they are compiled.
+
+Comparisons of affine functions of an integer with integer constants, e.g.
+``X * 2 + 1 >= 5``, are equivalent to interval tests on the integer itself
+(``X >= 2``), and the intervals of several such comparisons combine into a
+single ``lo <= x <= hi`` test.  Because the rewrite is only exact for
+integers (floats round, and other types may overload the operators),
+:func:`integer_intervals` identifies the comparisons which can be rewritten
+and the compiled check only uses the rewrite for int and long values.
+"""
+
+from proxy import Symbol
+
+# Types of the values, and of the constants, the rewrite is exact for.
+INTEGERS = (int, long)
+
+def _integer(value):
+    return type(value) in INTEGERS
+
+def affine(symbol):
+    """
+    Returns (a, b) if `symbol` computes ``a * X + b`` from a root Symbol X
+    using integer constants, folding them along the way, or None.
+    """
+    chain = []
+    while symbol.parent is not None:
+        chain.append(symbol)
+        symbol = symbol.parent
+    (a, b) = (1, 0)
+    for symbol in reversed(chain):
+        op, args = symbol._op, symbol._args
+        if op in ("__neg__", "__pos__"):
+            if op == "__neg__":
+                (a, b) = (-a, -b)
+            continue
+        if len(args) != 1 or not _integer(args[0]):
+            return None
+        c = args[0]
+        if op in ("__add__", "__radd__"):
+            b += c
+        elif op == "__sub__":
+            b -= c
+        elif op == "__rsub__":
+            (a, b) = (-a, c - b)
+        elif op in ("__mul__", "__rmul__"):
+            (a, b) = (a * c, b * c)
+        else:
+            return None
+    return (a, b)
+
+
+class Interval(object):
+    """
+    The integers x with ``lo <= x <= hi``, excluding the values in
+    `excluded`.  A bound of None is unbounded.
+    """
+
+    def __init__(self, lo=None, hi=None, excluded=()):
+        self.lo = lo
+        self.hi = hi
+        self.excluded = frozenset(excluded)
+
+    def __repr__(self):
+        return "Interval(%r, %r, %r)" % (self.lo, self.hi, sorted(self.excluded))
+
+    @property
+    def empty(self):
+        return self.lo is not None and self.hi is not None and self.lo > self.hi
+
+    def __contains__(self, x):
+        return ((self.lo is None or self.lo <= x) and
+                (self.hi is None or x <= self.hi) and x not in self.excluded)
+
+    def intersect(self, other):
+        """Returns the intersection of this interval with `other`."""
+        lo = max(b for b in (self.lo, other.lo) if b is not None) \
+            if self.lo is not None or other.lo is not None else None
+        hi = min(b for b in (self.hi, other.hi) if b is not None) \
+            if self.hi is not None or other.hi is not None else None
+        return Interval(lo, hi, self.excluded | other.excluded)
+
+    def source(self, argument):
+        """
+        Returns the source of a test that `argument` lies in this interval, or
+        None if every integer does.
+        """
+        if self.empty:
+            return "False"
+        excluded = sorted(x for x in self.excluded
+                          if (self.lo is None or self.lo <= x) and
+                          (self.hi is None or x <= self.hi))
+        tests = []
+        if self.lo is not None and self.hi is not None:
+            tests.append("%r <= %s <= %r" % (self.lo, argument, self.hi))
+        elif self.lo is not None:
+            tests.append("%s >= %r" % (argument, self.lo))
+        elif self.hi is not None:
+            tests.append("%s <= %r" % (argument, self.hi))
+        if len(excluded) > 3:
+            tests.append("%s not in %r" % (argument, frozenset(excluded)))
+        else:
+            tests.extend("%s != %r" % (argument, x) for x in excluded)
+        if not tests:
+            return None
+        return "(%s)" % " and ".join(tests)
+
+# The comparison with its operands swapped, for negative coefficients.
+_flipped = {"__ge__": "__le__", "__gt__": "__lt__", "__le__": "__ge__",
+            "__lt__": "__gt__", "__eq__": "__eq__", "__ne__": "__ne__"}
+
+def interval(predicate):
+    """
+    Returns the Interval of integers which satisfy `predicate` if it is a
+    comparison of an affine function of X with an integer, or None.
+    """
+    if not isinstance(predicate, Symbol) or predicate._op not in _flipped:
+        return None
+    if len(predicate._args) != 1 or not _integer(predicate._args[0]):
+        return None
+    coefficients = affine(predicate.parent)
+    if coefficients is None:
+        return None
+    (a, b) = coefficients
+    (op, r) = (predicate._op, predicate._args[0] - b)
+    if a == 0:
+        holds = {"__ge__": 0 >= r, "__gt__": 0 > r, "__le__": 0 <= r,
+                 "__lt__": 0 < r, "__eq__": 0 == r, "__ne__": 0 != r}[op]
+        return Interval() if holds else Interval(1, 0)
+    if a < 0:
+        (a, r, op) = (-a, -r, _flipped[op])
+    # a * x op r, with a > 0.
+    (floor, ceiling) = (r // a, -(-r // a))
+    if op == "__ge__":
+        return Interval(lo=ceiling)
+    if op == "__gt__":
+        return Interval(lo=floor + 1)
+    if op == "__le__":
+        return Interval(hi=floor)
+    if op == "__lt__":
+        return Interval(hi=ceiling - 1)
+    exact = r % a == 0
+    if op == "__eq__":
+        return Interval(floor, floor) if exact else Interval(1, 0)
+    return Interval(excluded=[floor]) if exact else Interval()
+
+def _operations(symbol):
+    count = 0
+    while symbol.parent is not None:
+        count += 1
+        symbol = symbol.parent
+    return count
+
+def integer_intervals(args):
+    """
+    Returns a dict mapping the indexes of the constraint arguments in `args`
+    which can be rewritten as interval tests on integers to their intervals.
+    The dict is empty unless the rewrite saves at least one operation.
+    """
+    intervals = {}
+    for (index, arg) in enumerate(args):
+        result = interval(arg)
+        if result is not None:
+            intervals[index] = result
+    if sum(_operations(args[index]) for index in intervals) < 2:
+        return {}
+    return intervals
@@ -3,8 +3,12 @@ proxy contains :class:`Symbol` and functions related to it.
 """
 
 from decorator import decorator
+from weakref import WeakValueDictionary
 import operator
+import keyword
 import types
+import re
+from decimal import Decimal
 
 def create_cell(obj):
     """
@@ -24,10 +28,461 @@ def copy_func(f, code=None, globals_=None, name=None, argdefs=None, closure=None
         closure or f.func_closure
     )
 
+# Live Symbols by (parent id, operation, arguments key), so that structurally
+# identical expressions are the same object.
+_interned = WeakValueDictionary()
+
+# The _kwargs of Symbols recorded without keyword arguments.
+_no_kwargs = {}
+
+# Types with equal values which behave differently, e.g. 0.0 and -0.0, or
+# Decimal("1.0") and Decimal("1.00"), and so are keyed by their repr.
+_inexact = (float, complex, Decimal)
+
+def _key(value, identity=True):
+    """
+    Returns a hashable key for `value` which distinguishes values that are
+    equal but of different types, e.g. 1 and 1.0, including as elements of
+    tuples and frozensets, or that behave differently, e.g. 0.0 and -0.0.
+    Symbols are keyed by identity.  Raises TypeError
+    if `value` is unhashable, or unless `identity` is true, if it is hashed
+    by identity (its type uses the default hash), as such objects may be
+    mutated without changing their key.
+    """
+    if isinstance(value, Symbol):
+        return (Symbol, id(value))
+    if type(value) is tuple:
+        return (tuple, tuple([_key(item, identity) for item in value]))
+    if type(value) is frozenset:
+        return (frozenset, frozenset([_key(item, identity) for item in value]))
+    if type(value) in _inexact:
+        return (type(value), repr(value))
+    if not identity and (type(value).__hash__ is object.__hash__ or
+                         type(value) is types.InstanceType):
+        raise TypeError("%s objects are hashed by identity" %
+                        type(value).__name__)
+    hash(value)
+    return (type(value), value)
+
 @decorator
 def chainable(f, self, *args, **kwargs):
-    """Chainable functions return Symbol objects."""
-    return type(self)(f(self, *args, **kwargs), self)
+    """
+    Chainable functions return Symbol objects.  The name of the operation and
+    its arguments are recorded on the result so that it can be compiled; the
+    decorated function itself is not called, as the code for the operation is
+    generated from its entry in _templates.
+    
+    Applying the same operation with the same hashable arguments to the same
+    Symbol returns the same Symbol, so expressions which share subexpressions
+    share nodes.
+    """
+    try:
+        key = (id(self), f.__name__, tuple(map(_key, args)),
+               _key(tuple(sorted(kwargs.items()))) if kwargs else ())
+    except TypeError:
+        key = None
+    else:
+        symbol = _interned.get(key)
+        if symbol is not None:
+            return symbol
+    symbol = type(self)(None, self)
+    symbol._op = f.__name__
+    symbol._args = args
+    symbol._kwargs = kwargs or _no_kwargs
+    if key is not None:
+        # The new Symbol references its parent and arguments, so the ids in
+        # the key stay valid for as long as the entry exists.
+        _interned[key] = symbol
+    return symbol
+
+@chainable
+def __apply__(self, function):
+    pass
+
+def apply(function, symbol):
+    """
+    Returns a Symbol representing `function` applied to the value of
+    `symbol`, e.g. ``apply(len, X) > 3``.  If `symbol` is not a Symbol,
+    returns ``function(symbol)``.
+    """
+    if isinstance(symbol, Symbol):
+        return __apply__(symbol, function)
+    return function(symbol)
+
+class Reference(object):
+    """Refers to an earlier node in an expression IR."""
+
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __reduce__(self):
+        return (Reference, (self.index,))
+
+def to_ir(*symbols):
+    """
+    Returns a picklable intermediate representation of Symbol expressions.
+    
+    The IR is a flat tuple of (operation, parent, args, kwargs) nodes in which
+    every node comes after the nodes it uses.  Parents and Symbol arguments
+    are given as :class:`Reference` objects (None for a root Symbol), and
+    nodes shared between or within the expressions appear once.  The
+    expressions themselves are the last len(`symbols`) nodes.
+    """
+    nodes = []
+    indexes = {}
+    def encode(value):
+        if isinstance(value, Symbol):
+            return Reference(indexes[id(value)])
+        return value
+    pending = list(reversed(symbols))
+    while pending:
+        symbol = pending[-1]
+        if id(symbol) in indexes:
+            pending.pop()
+            continue
+        operands = [o for o in _operands(symbol)
+                    if o is not None and id(o) not in indexes]
+        if symbol.parent is not None and operands:
+            pending.extend(operands)
+            continue
+        pending.pop()
+        indexes[id(symbol)] = len(nodes)
+        if symbol.parent is None:
+            nodes.append((None, None, (), {}))
+        else:
+            nodes.append((symbol._op, encode(symbol.parent),
+                          tuple(encode(a) for a in symbol._args),
+                          dict((k, encode(v)) for (k, v)
+                               in symbol._kwargs.items())))
+    return tuple(nodes) + tuple(Reference(indexes[id(s)]) for s in symbols)
+
+# The root of expressions rebuilt from IR, so that rebuilt expressions share
+# nodes with each other.
+_root = None
+
+def from_ir(ir):
+    """
+    Rebuild the Symbol expressions represented by `ir` (see :func:`to_ir`),
+    returning a single Symbol or, for several expressions, a tuple.
+    """
+    global _root
+    if _root is None:
+        _root = Symbol()
+    symbols = []
+    def decode(value):
+        if isinstance(value, Reference):
+            return symbols[value.index]
+        return value
+    for item in ir:
+        if isinstance(item, Reference):
+            break
+        (op, parent, args, kwargs) = item
+        if op is None:
+            symbols.append(_root)
+            continue
+        operation = __apply__ if op == "__apply__" else getattr(Symbol, op)
+        symbols.append(operation(decode(parent), *[decode(a) for a in args],
+                                 **dict((k, decode(v))
+                                        for (k, v) in kwargs.items())))
+    results = [decode(item) for item in ir if isinstance(item, Reference)]
+    return results[0] if len(results) == 1 else tuple(results)
+
+def _operands(symbol):
+    """Returns the Symbols `symbol` is computed from."""
+    operands = [symbol.parent]
+    operands.extend(arg for arg in symbol._args if isinstance(arg, Symbol))
+    operands.extend(arg for arg in symbol._kwargs.values()
+                    if isinstance(arg, Symbol))
+    return operands
+
+def attributes(*symbols):
+    """
+    Returns the names of the attributes of the root Symbol which `symbols`
+    read, or None if they use the root in another way, such as calling one of
+    its methods or passing it to a function, so that what they read is
+    unknown.
+    """
+    names = set()
+    seen = set()
+    pending = list(symbols)
+    while pending:
+        symbol = pending.pop()
+        if id(symbol) in seen:
+            continue
+        seen.add(id(symbol))
+        if symbol.parent is None:
+            return None
+        if symbol.parent.parent is None:
+            if symbol._op != "__getattr__":
+                return None
+            names.add(symbol._args[0])
+            continue
+        if (symbol._op == "__call__" and symbol.parent._op == "__getattr__" and
+                symbol.parent.parent.parent is None):
+            return None
+        pending.extend(_operands(symbol))
+    return names
+
+# Source templates for chainable operations.  {0} is the source of the parent
+# expression, {1} and {2} are the sources of the operation's arguments.
+_templates = {
+    "__getitem__": "{0}[{1}]",
+    "__reversed__": "reversed({0})",
+    "__hash__": "hash({0})",
+    "__invert__": "(~{0})",
+    "__index__": "_index({0})",
+    "__neg__": "(-{0})",
+    "__pos__": "(+{0})",
+    "__abs__": "abs({0})",
+    "__add__": "({0} + {1})",
+    "__sub__": "({0} - {1})",
+    "__mul__": "({0} * {1})",
+    "__floordiv__": "({0} // {1})",
+    "__mod__": "({0} % {1})",
+    "__divmod__": "divmod({0}, {1})",
+    "__lshift__": "({0} << {1})",
+    "__rshift__": "({0} >> {1})",
+    "__div__": "({0} / {1})",
+    "__truediv__": "_truediv({0}, {1})",
+    "__radd__": "({1} + {0})",
+    "__rand__": "({1} & {0})",
+    "__rdiv__": "({1} / {0})",
+    "__rdivmod__": "divmod({1}, {0})",
+    "__rfloordiv__": "({1} // {0})",
+    "__rlshift__": "({1} << {0})",
+    "__rmod__": "({1} % {0})",
+    "__rmul__": "({1} * {0})",
+    "__ror__": "({1} | {0})",
+    "__rpow__": "({1} ** {0})",
+    "__rrshift__": "({1} >> {0})",
+    "__rsub__": "({1} - {0})",
+    "__rtruediv__": "_truediv({1}, {0})",
+    "__rxor__": "({1} ^ {0})",
+    "__contains__": "({1} in {0})",
+    "__eq__": "({0} == {1})",
+    "__ne__": "({0} != {1})",
+    "__le__": "({0} <= {1})",
+    "__lt__": "({0} < {1})",
+    "__gt__": "({0} > {1})",
+    "__ge__": "({0} >= {1})",
+    "__cmp__": "cmp({0}, {1})",
+    "__and__": "({0} & {1})",
+    "__xor__": "({0} ^ {1})",
+    "__or__": "({0} | {1})",
+    "__iand__": "_iand({0}, {1})",
+    "__ixor__": "_ixor({0}, {1})",
+    "__ior__": "_ior({0}, {1})",
+    "__iadd__": "_iadd({0}, {1})",
+    "__isub__": "_isub({0}, {1})",
+    "__imul__": "_imul({0}, {1})",
+    "__idiv__": "_idiv({0}, {1})",
+    "__itruediv__": "_itruediv({0}, {1})",
+    "__ifloordiv__": "_ifloordiv({0}, {1})",
+    "__imod__": "_imod({0}, {1})",
+    "__ilshift__": "_ilshift({0}, {1})",
+    "__irshift__": "_irshift({0}, {1})",
+    "__apply__": "{1}({0})",
+}
+
+# Names available to all compiled code.
+_helpers = {
+    "_index": operator.index,
+    "_truediv": operator.truediv,
+    "_iand": operator.iand,
+    "_ixor": operator.ixor,
+    "_ior": operator.ior,
+    "_iadd": operator.iadd,
+    "_isub": operator.isub,
+    "_imul": operator.imul,
+    "_idiv": operator.idiv,
+    "_itruediv": operator.itruediv,
+    "_ifloordiv": operator.ifloordiv,
+    "_imod": operator.imod,
+    "_ipow": operator.ipow,
+    "_ilshift": operator.ilshift,
+    "_irshift": operator.irshift,
+}
+
+_literals = (int, long, float, bool, str, unicode, type(None))
+
+_identifier = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def _is_identifier(name):
+    return (isinstance(name, str) and _identifier.match(name) is not None
+            and not keyword.iskeyword(name))
+
+
+class Compiler(object):
+    """
+    Translates Symbol expressions into the source of a single flat Python
+    function, avoiding the chain of closure calls needed to evaluate a Symbol
+    node by node.
+    
+    Statements are accumulated with :meth:`statement`, and :meth:`build`
+    produces a function taking a single argument named `argument`.
+    Subexpressions marked by :meth:`share` are evaluated once, into
+    temporaries, the first time they are needed.
+    """
+
+    # Long chains are split across temporaries to stay clear of the parser's
+    # nesting limit.
+    max_depth = 32
+
+    def __init__(self, argument="x", parameters=()):
+        self.argument = argument
+        # Any further parameters of the compiled function.
+        self.parameters = list(parameters)
+        self.namespace = dict(_helpers)
+        self.lines = []
+        self._constants = {}
+        self._count = 0
+        # ids of shared Symbols, and the temporaries holding computed ones.
+        self._shared = set()
+        self._temporaries = {}
+        # Indentation level of new statements.
+        self.indent = 0
+
+    def name(self, prefix="_t"):
+        """Return a new unique local name."""
+        self._count += 1
+        return "%s%d" % (prefix, self._count)
+
+    def constant(self, value):
+        """Return source which evaluates to `value`."""
+        if isinstance(value, Symbol):
+            return self.expression(value)
+        if type(value) in _literals and (type(value) is not float or
+                                         abs(value) < float("inf")):
+            return repr(value)
+        name = self._constants.get(id(value))
+        if name is None:
+            name = self._constants[id(value)] = self.name("_c")
+            self.namespace[name] = value
+        return name
+
+    def share(self, expressions):
+        """
+        Mark the subexpressions used by more than one of `expressions`, or
+        more than once by one of them, to be evaluated only once.  This
+        assumes that evaluating them has no side effects.
+        """
+        uses = {}
+        seen = set()
+        pending = [e for e in expressions if isinstance(e, Symbol)]
+        for expression in pending:
+            uses[id(expression)] = uses.get(id(expression), 0) + 1
+        while pending:
+            symbol = pending.pop()
+            if id(symbol) in seen or symbol.parent is None:
+                continue
+            seen.add(id(symbol))
+            for operand in _operands(symbol):
+                uses[id(operand)] = uses.get(id(operand), 0) + 1
+                pending.append(operand)
+        self._shared.update(key for (key, count) in uses.items() if count > 1)
+
+    def expression(self, symbol):
+        """Return source which evaluates `symbol` against the argument."""
+        chain = []
+        while symbol.parent is not None and id(symbol) not in self._temporaries:
+            chain.append(symbol)
+            symbol = symbol.parent
+        source = self._temporaries.get(id(symbol), self.argument)
+        for depth, symbol in enumerate(reversed(chain)):
+            if depth and not depth % self.max_depth:
+                temporary = self.name()
+                self.statement("%s = %s" % (temporary, source))
+                source = temporary
+            source = self.computed(symbol, self._operation(symbol, source))
+        return source
+
+    def computed(self, symbol, source):
+        """
+        Returns the source to use for `symbol` given `source`, which computes
+        it.  Shared Symbols are assigned to temporaries.
+        """
+        if id(symbol) in self._shared:
+            temporary = self._temporaries[id(symbol)] = self.name()
+            self.statement("%s = %s" % (temporary, source))
+            source = temporary
+        return source
+
+    def _operation(self, symbol, source):
+        op, args, kwargs = symbol._op, symbol._args, symbol._kwargs
+        if op == "__getattr__":
+            if _is_identifier(args[0]):
+                return "%s.%s" % (source, args[0])
+            return "getattr(%s, %s)" % (source, self.constant(args[0]))
+        if op == "__call__":
+            arguments = [self.constant(a) for a in args]
+            if all(_is_identifier(k) for k in kwargs):
+                arguments.extend("%s=%s" % (k, self.constant(v))
+                                 for (k, v) in sorted(kwargs.items()))
+            elif kwargs:
+                arguments.append("**" + self.constant(kwargs))
+            return "%s(%s)" % (source, ", ".join(arguments))
+        if op == "__pow__":
+            if args[1] is not None:
+                return "pow(%s, %s, %s)" % (source, self.constant(args[0]),
+                                            self.constant(args[1]))
+            return "(%s ** %s)" % (source, self.constant(args[0]))
+        if op == "__ipow__":
+            if args[1] is not None:
+                return "%s.__ipow__(%s, %s)" % (source, self.constant(args[0]),
+                                                self.constant(args[1]))
+            return "_ipow(%s, %s)" % (source, self.constant(args[0]))
+        return _templates[op].format(source, *[self.constant(a) for a in args])
+
+    def statement(self, line):
+        """Append a line to the body of the compiled function."""
+        self.lines.append("    " * self.indent + line)
+
+    def forget(self):
+        """
+        Forget the temporaries computed so far, so that a new branch of the
+        compiled function computes shared subexpressions afresh.
+        """
+        self._temporaries.clear()
+
+    def build(self, name="compiled"):
+        """Compile the accumulated statements into a function."""
+        source = "def %s(%s):\n    %s\n" % (
+            name, ", ".join([self.argument] + self.parameters),
+            "\n    ".join(self.lines or ["pass"]))
+        exec(compile(source, "<constraints.proxy>", "exec"), self.namespace)
+        function = self.namespace[name]
+        function.__source__ = source
+        return function
+
+
+class _Describer(Compiler):
+    """Compiler which renders constants by repr, for display."""
+
+    max_depth = float("inf")
+
+    def constant(self, value):
+        if isinstance(value, Symbol):
+            return self.expression(value)
+        if callable(value):
+            return getattr(value, "__name__", None) or repr(value)
+        return repr(value)
+
+def describe(expression):
+    """
+    Returns a readable description of a Symbol expression, e.g.
+    ``((X * 2) + 1) >= 5``, or the name of any other callable.
+    """
+    if isinstance(expression, Symbol):
+        source = _Describer("X").expression(expression)
+        op = expression._op
+        if (_templates.get(op, "").startswith("(") or
+                op == "__pow__" and expression._args[1] is None):
+            # Drop the parentheses around the outermost operation.
+            source = source[1:-1]
+        return source
+    return getattr(expression, "__name__", None) or repr(expression)
 
 
 class Symbol(object):
@@ -40,13 +495,36 @@ class Symbol(object):
     built-in type/functions, such as int, float, bool, etc.
     """
 
+    # Every attribute is a slot, set in __init__ so that reading one never
+    # falls through to __getattr__.  _op, _args and _kwargs are the operation
+    # recorded by chainable.
+    __slots__ = ("_f", "parent", "_op", "_args", "_kwargs", "_compiled",
+                 "__weakref__")
+
     def __init__(self, f=None, parent=None):
         self._f = f
         self.parent = parent
+        self._op = None
+        self._args = ()
+        self._kwargs = _no_kwargs
+        self._compiled = None
 
     @property
     def f(self):
-        return self._f()
+        """
+        The value of this Symbol given the value assigned to the root Symbol.
+        
+        .. note::
+        
+            Assigning to the root mutates state shared by every Symbol derived
+            from it; use :meth:`__evaluate__` to evaluate expressions.
+        """
+        if self.parent is None:
+            return self._f()
+        root = self.parent
+        while root.parent is not None:
+            root = root.parent
+        return self.__evaluate__(root._f())
 
     @f.setter
     def f(self, func):
@@ -56,244 +534,262 @@ class Symbol(object):
             self._f = func
 
     def __evaluate__(self, f):
-        current = self
-        while current.parent is not None:
-            current = current.parent
-        current.f = f
-        return self.f
+        """
+        Evaluate the expression this Symbol represents with `f` in place of
+        the root Symbol.  The expression tree is never modified, so the same
+        Symbol can be evaluated from several threads at once.
+        """
+        return self.__compile__()(f)
+
+    def __reduce__(self):
+        return (from_ir, (to_ir(self),))
+
+    def __compile__(self):
+        """
+        Compile the expression this Symbol represents into a single argument
+        function, e.g. ``X * 2 + 1 >= 5`` becomes ``lambda x: x * 2 + 1 >= 5``.
+        The compiled function is cached on the Symbol.
+        """
+        compiled = self._compiled
+        if compiled is None:
+            compiler = Compiler()
+            compiler.share([self])
+            compiler.statement("return " + compiler.expression(self))
+            compiled = self._compiled = compiler.build()
+        return compiled
 
     @chainable
     def __call__(self, *args, **kwargs):
-        return lambda: self.f(*args, **kwargs)
+        pass
 
     @chainable
     def __getattr__(self, attr):
-        return lambda: getattr(self.f, attr)
+        pass
 
     @chainable
     def __reversed__(self):
-        return lambda: reversed(self.f)
+        pass
 
     @chainable
     def __getitem__(self, item):
-        return lambda: self.f[item]
+        pass
 
     @chainable
     def __hash__(self):
-        return lambda: hash(self.f)
+        pass
 
     @chainable
     def __invert__(self):
-        return lambda:~self.f
+        pass
 
     @chainable
     def __index__(self):
-        return lambda: operator.index(self.f)
+        pass
 
     @chainable
     def __neg__(self):
-        return lambda:-self.f
+        pass
 
     @chainable
     def __pos__(self):
-        return lambda:+self.f
+        pass
 
     @chainable
     def __abs__(self):
-        return lambda: abs(self.f)
+        pass
 
     @chainable
     def __add__(self, other):
-        return lambda: self.f + other
+        pass
 
     @chainable
     def __sub__(self, other):
-        return lambda: self.f - other
+        pass
 
     @chainable
     def __mul__(self, other):
-        return lambda: self.f * other
+        pass
 
     @chainable
     def __floordiv__(self, other):
-        return lambda: self.f // other
+        pass
 
     @chainable
     def __mod__(self, other):
-        return lambda: self.f % other
+        pass
 
     @chainable
     def __divmod__(self, other):
-        return lambda: divmod(self.f, other)
+        pass
 
     @chainable
     def __pow__(self, other, modulo=None):
-        return lambda: pow(self.f, other, modulo)
+        pass
 
     @chainable
     def __lshift__(self, other):
-        return lambda: self.f << other
+        pass
 
     @chainable
     def __rshift__(self, other):
-        return lambda: self.f >> other
+        pass
 
     @chainable
     def __div__(self, other):
-        return lambda: self.f / other
+        pass
 
     @chainable
     def __truediv__(self, other):
-        return lambda: self.f.__truediv__(other)
+        pass
 
     @chainable
     def __radd__(self, other):
-        return lambda: other + self.f
+        pass
 
     @chainable
     def __rand__(self, other):
-        return lambda: other & self.f
+        pass
 
     @chainable
     def __rdiv__(self, other):
-        return lambda: other / self.f
+        pass
 
     @chainable
     def __rdivmod__(self, other):
-        return lambda: divmod(other, self.f)
+        pass
 
     @chainable
     def __rfloordiv__(self, other):
-        return lambda: other // self
+        pass
 
     @chainable
     def __rlshift__(self, other):
-        return lambda:other << self
+        pass
 
     @chainable
     def __rmod__(self, other):
-        return lambda:other % self
+        pass
 
     @chainable
     def __rmul__(self, other):
-        return lambda: other * self
+        pass
 
     @chainable
     def __ror__(self, other):
-        return lambda: other | self
+        pass
 
     @chainable
     def __rpow__(self, other):
-        return lambda: pow(other, self)
+        pass
 
     @chainable
     def __rrshift__(self, other):
-        return lambda: other >> self
+        pass
 
     @chainable
     def __rsub__(self, other):
-        return lambda: other - self
+        pass
 
     @chainable
     def __rtruediv__(self, other):
-        return lambda: self.__rtruediv__(other)
+        pass
 
     @chainable
     def __rxor__(self, other):
-        return lambda: other ^ self
+        pass
 
     @chainable
     def __contains__(self, item):
-        return lambda: item in self.f
+        pass
 
     @chainable
     def __eq__(self, other):
-        return lambda: self.f == other
+        pass
 
     @chainable
     def __ne__(self, other):
-        return lambda: self.f != other
+        pass
 
     @chainable
     def __le__(self, other):
-        return lambda: self.f <= other
+        pass
 
     @chainable
     def __lt__(self, other):
-        return lambda: self.f < other
+        pass
 
     @chainable
     def __gt__(self, other):
-        return lambda: self.f > other
+        pass
 
     @chainable
     def __ge__(self, other):
-        return lambda: self.f >= other
+        pass
 
     @chainable
     def __cmp__(self, other):
-        return lambda: cmp(self.f, other)
+        pass
 
     @chainable
     def __and__(self, other):
-        return lambda: self.f & other
+        pass
 
     @chainable
     def __xor__(self, other):
-        return lambda: self.f ^ other
+        pass
 
     @chainable
     def __or__(self, other):
-        return lambda: self.f | other
+        pass
 
     @chainable
     def __iand__(self, other):
-        return lambda: self.f.__iand__(other)
+        pass
 
     @chainable
     def __ixor__(self, other):
-        return lambda: self.f.__ixor__(other)
+        pass
 
     @chainable
     def __ior__(self, other):
-        return lambda: self.f.__ior__(other)
+        pass
 
     @chainable
     def __iadd__(self, other):
-        return lambda: self.f.__iadd__(other)
+        pass
 
     @chainable
     def __isub__(self, other):
-        return lambda: self.f.__isub__(other)
+        pass
 
     @chainable
     def __imul__(self, other):
-        return lambda: self.f.__imul__(other)
+        pass
 
     @chainable
     def __idiv__(self, other):
-        return lambda: self.f.__idiv__(other)
+        pass
 
     @chainable
     def __itruediv__(self, other):
-        return lambda: self.f.__itruediv__(other)
+        pass
 
     @chainable
     def __ifloordiv__(self, other):
-        return lambda: self.f.__ifloordiv__(other)
+        pass
 
     @chainable
     def __imod__(self, other):
-        return lambda: self.f.__imod__(other)
+        pass
 
     @chainable
     def __ipow__(self, other, modulo=None):
-        return lambda: self.f.__ipow__(other, modulo)
+        pass
 
     @chainable
     def __ilshift__(self, other):
-        return lambda: self.f.__ilshift__(other)
+        pass
 
     @chainable
     def __irshift__(self, other):
-        return lambda: self.f.__irshift__(other)
+        pass
@@ -0,0 +1,245 @@
+"""
+schema compiles declarative, JSON-Schema-like validation rules into
+constraints::
+
+    Order = load({
+        "type": "object",
+        "required": ["id", "quantity"],
+        "properties": {
+            "id": {"type": "string", "pattern": "^[A-Z]{3}-[0-9]+$"},
+            "quantity": {"type": "integer", "minimum": 1, "maximum": 100},
+            "tags": {"type": "array", "items": {"type": "string"},
+                     "maxItems": 10},
+        },
+    })
+    isinstance({"id": "ABC-1", "quantity": 3}, Order)
+
+The whole schema, including nested object and array schemas, is compiled into
+a single generated function, so checking a value makes no per-field calls.
+
+Supported keywords are type (a name or a list of names), enum, const,
+minimum, maximum, exclusiveMinimum, exclusiveMaximum, multipleOf, minLength,
+maxLength, pattern, properties, required, additionalProperties, minProperties,
+maxProperties, items, minItems, maxItems, uniqueItems and allOf.  As in JSON
+Schema, keywords for one type are ignored for values of other types,
+patterns match anywhere in a string unless anchored, and enum, const and
+uniqueItems treat numbers as equal whatever their Python type, but never
+booleans and numbers.  Other keywords raise ValueError, so that misspelt
+rules are not silently ignored.
+"""
+
+from proxy import Compiler
+from constraints import Constraints
+from util import _compile
+
+# Type names, and the source of a test that a value `{0}` has the type.
+_types = {
+    "null": "{0} is None",
+    "boolean": "type({0}) is bool",
+    "integer": "type({0}) in (int, long)",
+    "number": "type({0}) in (int, long, float)",
+    "string": "isinstance({0}, basestring)",
+    "array": "isinstance({0}, (list, tuple))",
+    "object": "isinstance({0}, dict)",
+}
+
+# The types each keyword applies to, or None for any type.
+_keywords = {
+    "type": None, "enum": None, "const": None, "allOf": None,
+    "title": None, "description": None, "default": None, "examples": None,
+    "$schema": None, "$id": None, "$comment": None,
+    "minimum": "number", "maximum": "number", "exclusiveMinimum": "number",
+    "exclusiveMaximum": "number", "multipleOf": "number",
+    "minLength": "string", "maxLength": "string", "pattern": "string",
+    "properties": "object", "required": "object",
+    "additionalProperties": "object", "minProperties": "object",
+    "maxProperties": "object",
+    "items": "array", "minItems": "array", "maxItems": "array",
+    "uniqueItems": "array",
+}
+
+# The type names covered by each type name.
+_covers = {"number": ("integer", "number")}
+
+
+class _SchemaCompiler(Compiler):
+    """Compiler which generates statements rejecting values that don't match."""
+
+    def reject_unless(self, test):
+        self.statement("if not (%s): return False" % test)
+
+    def block(self, line):
+        """Start a nested block, to be ended with :meth:`end`."""
+        self.statement(line)
+        self.indent += 1
+
+    def end(self):
+        if self.lines[-1].endswith(":"):
+            self.statement("pass")
+        self.indent -= 1
+
+    def schema(self, schema, value):
+        """Add statements rejecting `value` (source) unless it matches `schema`."""
+        if schema is True or schema == {}:
+            return
+        if schema is False:
+            self.statement("return False")
+            return
+        if not isinstance(schema, dict):
+            raise ValueError("A schema must be a dict or bool, not %r" % (schema,))
+        unknown = set(schema) - set(_keywords)
+        if unknown:
+            raise ValueError("Unsupported schema keywords: %s" %
+                             ", ".join(sorted(unknown)))
+        types = schema.get("type")
+        if isinstance(types, basestring):
+            types = [types]
+        if types is not None:
+            for name in types:
+                if name not in _types:
+                    raise ValueError("Unknown type %r" % (name,))
+            self.reject_unless(" or ".join(_types[name].format(value)
+                                           for name in types))
+        if "enum" in schema:
+            members = frozenset(_key(member) for member in schema["enum"])
+            self.reject_unless("_key(%s) in %s" % (value, self.constant(members)))
+            self.namespace["_key"] = _key
+        if "const" in schema:
+            self.reject_unless("_key(%s) == %s" % (
+                value, self.constant(_key(schema["const"]))))
+            self.namespace["_key"] = _key
+        for subschema in schema.get("allOf", ()):
+            self.schema(subschema, value)
+        for kind in ("number", "string", "object", "array"):
+            keywords = [k for k in schema if _keywords[k] == kind]
+            if not keywords:
+                continue
+            guarded = types is None or any(
+                name not in _covers.get(kind, (kind,)) for name in types)
+            if guarded:
+                if types is not None and not any(
+                        name in _covers.get(kind, (kind,)) for name in types):
+                    # The keywords can't apply to values of the allowed types.
+                    continue
+                self.block("if %s:" % _types[kind].format(value))
+            getattr(self, kind)(schema, value)
+            if guarded:
+                self.end()
+
+    def number(self, schema, value):
+        for (keyword, operator) in (("minimum", ">="), ("maximum", "<="),
+                                    ("exclusiveMinimum", ">"),
+                                    ("exclusiveMaximum", "<")):
+            if keyword in schema:
+                self.reject_unless("%s %s %s" % (value, operator,
+                                                 self.constant(schema[keyword])))
+        if "multipleOf" in schema:
+            self.reject_unless("%s %% %s == 0" % (
+                value, self.constant(schema["multipleOf"])))
+
+    def string(self, schema, value):
+        if "minLength" in schema:
+            self.reject_unless("len(%s) >= %d" % (value, schema["minLength"]))
+        if "maxLength" in schema:
+            self.reject_unless("len(%s) <= %d" % (value, schema["maxLength"]))
+        if "pattern" in schema:
+            search = self.constant(_compile(schema["pattern"]).search)
+            self.reject_unless("%s(%s) is not None" % (search, value))
+
+    def object(self, schema, value):
+        for name in schema.get("required", ()):
+            self.reject_unless("%s in %s" % (self.constant(name), value))
+        if "minProperties" in schema:
+            self.reject_unless("len(%s) >= %d" % (value, schema["minProperties"]))
+        if "maxProperties" in schema:
+            self.reject_unless("len(%s) <= %d" % (value, schema["maxProperties"]))
+        properties = schema.get("properties", {})
+        required = set(schema.get("required", ()))
+        for (name, subschema) in sorted(properties.items()):
+            if subschema is True or subschema == {}:
+                continue
+            key = self.constant(name)
+            item = self.name()
+            if name in required:
+                self.statement("%s = %s[%s]" % (item, value, key))
+                self.schema(subschema, item)
+                continue
+            self.block("if %s in %s:" % (key, value))
+            self.statement("%s = %s[%s]" % (item, value, key))
+            self.schema(subschema, item)
+            self.end()
+        additional = schema.get("additionalProperties", True)
+        if additional is True or additional == {}:
+            return
+        item = self.name()
+        known = self.constant(frozenset(properties))
+        self.block("for %s in %s:" % (item, value))
+        self.block("if %s not in %s:" % (item, known))
+        self.schema(additional, "%s[%s]" % (value, item))
+        self.end()
+        self.end()
+
+    def array(self, schema, value):
+        if "minItems" in schema:
+            self.reject_unless("len(%s) >= %d" % (value, schema["minItems"]))
+        if "maxItems" in schema:
+            self.reject_unless("len(%s) <= %d" % (value, schema["maxItems"]))
+        if schema.get("uniqueItems"):
+            self.reject_unless("_unique(%s)" % value)
+            self.namespace["_unique"] = _unique
+        items = schema.get("items", True)
+        if items is True or items == {}:
+            return
+        if isinstance(items, list):
+            raise ValueError("Tuple validation (a list of item schemas) is not"
+                             " supported")
+        item = self.name()
+        self.block("for %s in %s:" % (item, value))
+        self.schema(items, item)
+        self.end()
+
+def _key(value):
+    """
+    Returns a hashable key for `value` which is equal to the key of another
+    value iff they are equal JSON values: numbers are compared whatever their
+    Python type, but booleans are not numbers, and arrays and objects are
+    compared by their items.  Other unhashable values are keyed by identity.
+    """
+    if isinstance(value, bool):
+        return (bool, value)
+    if isinstance(value, (int, long, float)):
+        return (float, value)
+    if isinstance(value, basestring):
+        return (basestring, value)
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(map(_key, value)))
+    if isinstance(value, dict):
+        return (dict, frozenset((_key(k), _key(v)) for (k, v) in value.items()))
+    try:
+        hash(value)
+    except TypeError:
+        return (id, id(value))
+    return (type(value), value)
+
+def _unique(items):
+    return len(set(map(_key, items))) == len(items)
+
+def compile_schema(schema, name="schema"):
+    """
+    Returns a function of one argument which returns True if the argument
+    matches `schema`.  The generated source is the function's __source__.
+    """
+    compiler = _SchemaCompiler()
+    compiler.schema(schema, compiler.argument)
+    compiler.statement("return True")
+    return compiler.build(name)
+
+def load(schema, **options):
+    """
+    Returns a :class:`~constraints.constraints.Constraints` class which
+    checks values against `schema`, with `options` as for Constraints.  The
+    class's `schema` attribute is the schema.
+    """
+    constraint = Constraints(compile_schema(schema), **options)
+    constraint.schema = schema
+    return constraint
@@ -2,9 +2,26 @@
 util provides some simple wrappers for commonly used built-in functions that
 are frequently used in validation.  This module is likely to change in the
 future.
+
+The collection functions :func:`Each`, :func:`AnyOf`, :func:`SumOf`,
+:func:`MinOf`, :func:`MaxOf` and :func:`LenOf` build Symbol expressions over
+the collection being validated, for example::
+
+    Constraints(Each(X, SizeConstraint), SumOf(X) < 100)
+
+They supersede the _all, _any, _sum, _min and _max wrappers, which close over
+a fixed collection.
 """
 
 import re
+from threading import local, Lock
+from proxy import apply
+from constraints import Constraints, _checker
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 def _any(iterable):
     return lambda x = None: any(iterable)
@@ -33,6 +50,225 @@ def _min(iterable):
 def _max(iterable):
     return lambda x = None: max(iterable)
 
+def _array(value):
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+class _Elements(object):
+    """
+    Base class for checks of the elements of a collection against a
+    constraint.  Equal checks compare equal, so that the Symbols which apply
+    them are shared.
+    """
+
+    def __init__(self, constraint):
+        self.constraint = constraint
+        self.check = _checker(constraint)
+        self.__name__ = "%s[%s]" % (type(self).__name__.lstrip("_"),
+                                    getattr(constraint, "__name__", constraint))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.constraint is other.constraint
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self), id(self.constraint)))
+
+    def __reduce__(self):
+        # The compiled check can't be pickled, so it is made again.
+        return (type(self), (self.constraint,))
+
+    def mask(self, array):
+        """
+        Returns the elementwise mask for a numpy `array`, or None if the
+        constraint can't be applied to arrays.
+        """
+        if isinstance(self.constraint, Constraints):
+            return self.constraint.mask(array)
+        return None
+
+
+class _Each(_Elements):
+    """Checks that every element of a collection satisfies a constraint."""
+
+    def failure(self, collection):
+        """
+        Returns the index of the first element of `collection` which does not
+        satisfy the constraint, or None if they all do.
+        """
+        if _array(collection):
+            mask = self.mask(collection)
+            if mask is not None:
+                failures = numpy.flatnonzero(~mask)
+                return int(failures[0]) if len(failures) else None
+        check = self.check
+        for (index, element) in enumerate(collection):
+            if not check(element):
+                return index
+        return None
+
+    def __call__(self, collection):
+        return self.failure(collection) is None
+
+
+class _AnyOf(_Elements):
+    """Checks that some element of a collection satisfies a constraint."""
+
+    def __call__(self, collection):
+        if _array(collection):
+            mask = self.mask(collection)
+            if mask is not None:
+                return bool(mask.any())
+        check = self.check
+        for element in collection:
+            if check(element):
+                return True
+        return False
+
+def Each(collection, constraint):
+    """
+    Returns an expression which is true if every element of `collection`
+    satisfies `constraint`.  Checking stops at the first failing element;
+    use :func:`first_failure` to find its index.  numpy arrays are checked
+    with :meth:`ConstraintBase.mask` when `constraint` is a Constraints class.
+    """
+    return apply(_Each(constraint), collection)
+
+def AnyOf(collection, constraint):
+    """
+    Returns an expression which is true if any element of `collection`
+    satisfies `constraint`, stopping at the first one that does.
+    """
+    return apply(_AnyOf(constraint), collection)
+
+def first_failure(expression, value):
+    """
+    Returns the index of the first element which fails the :func:`Each`
+    expression `expression` when it is evaluated against `value`, or None.
+    """
+    return expression._args[0].failure(expression.parent.__evaluate__(value))
+
+def _sum_of(collection):
+    return collection.sum() if _array(collection) else sum(collection)
+
+def _min_of(collection):
+    return collection.min() if _array(collection) else min(collection)
+
+def _max_of(collection):
+    return collection.max() if _array(collection) else max(collection)
+
+def SumOf(collection):
+    """Returns an expression for the sum of the elements of `collection`."""
+    return apply(_sum_of, collection)
+
+def MinOf(collection):
+    """Returns an expression for the smallest element of `collection`."""
+    return apply(_min_of, collection)
+
+def MaxOf(collection):
+    """Returns an expression for the largest element of `collection`."""
+    return apply(_max_of, collection)
+
+def LenOf(collection):
+    """Returns an expression for the length of `collection`."""
+    return apply(len, collection)
+
+# Compiled regular expressions, shared process-wide.
+_compiled = {}
+_compiled_lock = Lock()
+
+def _compile(pattern):
+    rexpr = _compiled.get(pattern)
+    if rexpr is None:
+        with _compiled_lock:
+            rexpr = _compiled.get(pattern)
+            if rexpr is None:
+                rexpr = _compiled[pattern] = re.compile(pattern)
+    return rexpr
+
 def matches(other):
-    rexpr = re.compile(other)
+    rexpr = _compile(other)
     return lambda x: rexpr.match(x)
+
+# Constructs which depend on the rest of the pattern, or on group numbering,
+# and so can't be merged with other patterns: backreferences, named groups,
+# conditionals and inline flags (which apply to the whole expression).
+_unmergeable = re.compile(r"\\[1-9]|\(\?P|\(\?\(|\(\?[iLmsux]")
+
+# The most groups the re module supports in one expression.
+_max_groups = 99
+
+
+class MultiPattern(object):
+    """
+    Matches strings against many regular expressions at once.
+    
+    The patterns are merged into a compiled expression in which each pattern
+    is an optional lookahead with its own named group, so one match call
+    reports every pattern which matches at the start of the string (as
+    :func:`matches` does).  As the number of groups in an expression is
+    limited, many patterns are split between several expressions.  Patterns using backreferences, named groups,
+    conditionals or inline flags are matched separately.  The result for the
+    last string checked is remembered per thread, so several constraints
+    using patterns from one MultiPattern cost one scan per value::
+    
+        methods = MultiPattern({"read": "GET|HEAD", "write": "POST|PUT"})
+        Readable = Constraints(methods.matcher("read"))
+    
+    :param patterns: A dict mapping names to patterns, or a sequence of
+        patterns, which are then their own names.
+    """
+
+    def __init__(self, patterns):
+        if not isinstance(patterns, dict):
+            patterns = dict((pattern, pattern) for pattern in patterns)
+        self.patterns = patterns
+        self._groups = {}
+        self._separate = {}
+        # Lists of the merged patterns of each expression, and the number
+        # of groups in the last one.
+        merged = []
+        count = 0
+        for (name, pattern) in sorted(patterns.items()):
+            groups = 0 if _unmergeable.search(pattern) else \
+                re.compile(pattern).groups + 1
+            if not groups or groups > _max_groups:
+                self._separate[name] = _compile(pattern)
+                continue
+            if not merged or count + groups > _max_groups:
+                merged.append([])
+                count = 0
+            count += groups
+            group = "_%d" % len(self._groups)
+            self._groups[group] = name
+            merged[-1].append("(?:(?=(?P<%s>%s))|)" % (group, pattern))
+        self._merged = [_compile("".join(parts)) for parts in merged]
+        self._last = local()
+
+    def matching(self, string):
+        """Returns the frozenset of the names of the patterns `string` matches."""
+        last = self._last
+        if getattr(last, "string", None) is string:
+            return last.names
+        names = []
+        for rexpr in self._merged:
+            groups = rexpr.match(string).groupdict()
+            names.extend(self._groups[group] for (group, value) in groups.items()
+                         if value is not None)
+        names.extend(name for (name, rexpr) in self._separate.items()
+                     if rexpr.match(string))
+        last.string = string
+        last.names = names = frozenset(names)
+        return names
+
+    def matcher(self, name):
+        """Returns a constraint which is satisfied by strings matching `name`."""
+        if name not in self.patterns:
+            raise KeyError(name)
+        return lambda x: name in self.matching(x)
+
+    def any(self):
+        """Returns a constraint which is satisfied by strings matching any pattern."""
+        return lambda x: bool(self.matching(x))
@@ -17,6 +17,7 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=["decorator"],
+    extras_require={"numpy": ["numpy"]},
     classifiers=[
         "Development Status :: 3 - Alpha",
         "License :: OSI Approved :: BSD License",